@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+''' size and read latency of cache layouts
+
+    fills a plain file store and sqlite stores without compression,
+    with zlib and (if zstandard is installed) zstd, with a synthetic
+    corpus built from the words of fixtures/*.txt, then reports disk
+    usage and median latency of a cache hit through util.get_lyrics
+
+    usage: python benchmarks/bench_cache.py [tracks] [reads]
+'''
+from pathlib import Path
+from statistics import median
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lyrics import cache, compress, util
+
+FIXTURES = Path(__file__).resolve().parent.joinpath('fixtures')
+
+
+def corpus(tracks, seed=1):
+    ''' returns {track name: lyrics lines}, songs of verses and a
+        repeated chorus made of fixture words
+    '''
+    words = []
+    for path in sorted(FIXTURES.glob('*.txt')):
+        words += path.read_text().split()
+    rnd = random.Random(seed)
+
+    def line():
+        return ' '.join(rnd.choice(words) for _ in range(rnd.randint(4, 9)))
+
+    songs = {}
+    for i in range(tracks):
+        chorus = [line() for _ in range(rnd.randint(3, 5))]
+        lines = []
+        for verse in range(1, rnd.randint(2, 4)):
+            lines += [f'[Verse {verse}]'] + [line() for _ in range(rnd.randint(4, 8))]
+            lines += ['', '[Chorus]'] + chorus + ['']
+        songs[f'Artist {i % 97} - Title {i}'] = lines
+    return songs
+
+
+def disk_usage(path):
+    ''' returns (allocated bytes, apparent bytes) of files under path
+    '''
+    allocated = apparent = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            st = os.stat(os.path.join(root, name))
+            allocated += st.st_blocks * 512
+            apparent += st.st_size
+    return allocated, apparent
+
+
+def bench(name, store, songs, reads):
+    for track, lines in songs.items():
+        store.put(util.get_key(track), lines, track=track)
+    if getattr(store, 'compression', None) is not None:
+        # every record with the dictionary trained from all of them
+        store.recompress()
+    if isinstance(store, cache.SQLiteStore):
+        with store.lock:
+            store.db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    cache.store = store
+    names = random.Random(2).choices(list(songs), k=reads)
+    times = []
+    ok = True
+    for track in names:
+        cache.memory.clear()
+        start = time.perf_counter()
+        lyrics, source = util.get_lyrics(track)
+        times.append((time.perf_counter() - start) * 1e6)
+        ok &= source == 'cache' and lyrics == songs[track]
+
+    allocated, apparent = disk_usage(store.path)
+    print(f'{name:12} disk {allocated / 1024:9.0f} KiB  '
+          f'bytes {apparent / 1024:9.0f} KiB  '
+          f'read median {median(times):7.1f} us  p99 {sorted(times)[int(len(times) * 0.99)]:7.1f} us  '
+          f'{"ok" if ok else "MISMATCH"}')
+    return ok
+
+
+def main():
+    tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    reads = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    songs = corpus(tracks)
+
+    text = sum(len('\n'.join(lines).encode('utf-8')) for lines in songs.values())
+    print(f'{tracks} tracks, {text / 1024:.0f} KiB of lyrics')
+
+    layouts = [('files', lambda path: cache.FileStore(path)),
+               ('sqlite', lambda path: cache.SQLiteStore(path))]
+    for algorithm in compress.ALGORITHMS:
+        if compress.available(algorithm):
+            layouts.append((f'sqlite+{algorithm}',
+                            lambda path, a=algorithm: cache.SQLiteStore(path, compression=a)))
+        else:
+            print(f'sqlite+{algorithm}: not installed, skipped')
+
+    ok = True
+    for name, create in layouts:
+        with tempfile.TemporaryDirectory() as path:
+            ok &= bench(name, create(path), songs, reads)
+            cache.store = None
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+''' micro-benchmark of genius/azlyrics parsers on saved pages
+
+    compares util.parse_genius/parse_azlyrics against the previous
+    regex based parsers, checks output against fixtures/*.txt
+
+    genius_multi has lyrics split over several containers with ads
+    between and inside them, as genius serves longer songs
+
+    usage: python benchmarks/bench_parsers.py [iterations]
+'''
+from pathlib import Path
+from timeit import timeit
+
+import re
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lyrics import util
+
+FIXTURES = Path(__file__).resolve().parent.joinpath('fixtures')
+
+
+def old_parse_genius(html):
+    gns_regex = re.compile(
+        '<div data-lyrics-container="true" (?:.*?)(>.*?<)/div>', re.S)
+    ly = gns_regex.findall(html)
+
+    if not ly:
+        return None
+
+    lyrics_lines = ''
+    for ly_section in ly:
+        ly_section = ly_section.replace('&#x27;', "'")
+        line_regex = re.compile(r'>([^<]+?)<', re.S)
+        lines = line_regex.findall(ly_section)
+        lyrics_lines += "\n".join(lines)
+
+    lyrics_lines = re.sub(r'\n{2,}', '\n', lyrics_lines)
+    lyrics_lines = lyrics_lines.replace('\n[', '\n\n[').replace('&quot;', '"')
+
+    # get_lyrics used to replace &amp; afterwards
+    return [line.replace('&amp;', '&') for line in lyrics_lines.split('\n')]
+
+
+def old_parse_azlyrics(html):
+    az_regex = re.compile(
+        r'Sorry about that. -->(.*)(?:<script>(.*))<!-- MxM banner -->', re.S)
+
+    ly = az_regex.search(html)
+    if ly == None:
+        return None
+
+    ly = re.sub(r'<[/]?\w*?>', '', ly.group(1)).strip()
+
+    rep = {'&quot;': '\"', '&amp;': '&', '\r': ''}
+    replace_patten = '|'.join(rep.keys())
+    ly = re.sub(replace_patten, lambda match: rep[match.group(0)], ly)
+
+    return ly.split('\n')
+
+
+def bench(name, old, new, iterations):
+    with open(FIXTURES.joinpath(name + '.html'), newline='') as file:
+        html = file.read()
+    expected = FIXTURES.joinpath(name + '.txt').read_text().splitlines()
+
+    new_output = new(html)
+    old_output = old(html)
+
+    old_time = timeit(lambda: old(html), number=iterations) / iterations
+    new_time = timeit(lambda: new(html), number=iterations) / iterations
+
+    print(f'{name:12} {len(html) // 1024:5} KiB  '
+          f'old {old_time * 1000:8.3f} ms  new {new_time * 1000:8.3f} ms  '
+          f'speedup {old_time / new_time:6.1f}x  '
+          f'new output {"ok" if new_output == expected else "MISMATCH"}  '
+          f'old output {"ok" if old_output == expected else "differs"}')
+
+    return new_output == expected
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    ok = bench('genius', old_parse_genius, util.parse_genius, iterations)
+    ok &= bench('genius_multi', old_parse_genius, util.parse_genius, iterations)
+    ok &= bench('azlyrics', old_parse_azlyrics, util.parse_azlyrics, iterations)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+''' startup benchmark of `lyrics -t artist title` served from cache
+
+    runs the one-shot mode in a fresh interpreter with `-X importtime`
+    against a temporary HOME holding one cached track, reports wall time
+    and import time and fails if a module that the fast path must not
+    load is imported or the budget is exceeded
+
+    usage: python benchmarks/bench_startup.py [runs] [budget ms]
+'''
+from pathlib import Path
+from statistics import median
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ARTIST = 'Bench Artist'
+TITLE = 'Bench Title'
+
+# never needed to print cached lyrics
+FORBIDDEN = ('requests', 'urllib3', 'curses', 'dbus', 'mpd', 'gi', 'mutagen')
+
+CLI = ('import sys; from lyrics.lyrics_in_terminal import main; '
+       f'sys.argv = ["lyrics", "-t", {ARTIST!r}, {TITLE!r}]; main()')
+
+SEED = ('from lyrics import cache, util; '
+        f'cache.get_store().put(util.get_key("{ARTIST} - {TITLE}"), '
+        '["first line", "second line"], source="bench")')
+
+
+def run(code, env, importtime=False):
+    args = [sys.executable]
+    if importtime:
+        args += ['-X', 'importtime']
+    return subprocess.run(args + ['-c', code], env=env, cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr):
+    ''' returns (top level modules imported, total cumulative us)
+    '''
+    modules = set()
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.rstrip()
+        modules.add(name.strip().split('.')[0])
+        # top level imports are not indented
+        if not name.startswith('  '):
+            total += int(cumulative)
+    return modules, total
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 150
+
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, PYTHONPATH=str(ROOT))
+        run(SEED, env)
+
+        output = run(CLI, env).stdout
+        if 'first line' not in output:
+            print('cached lyrics not printed:\n' + output)
+            sys.exit(1)
+
+        wall = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            run(CLI, env)
+            wall.append((time.perf_counter() - start) * 1000)
+
+        baseline = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            run('pass', env)
+            baseline.append((time.perf_counter() - start) * 1000)
+
+        modules, total = parse_importtime(run(CLI, env, importtime=True).stderr)
+
+    forbidden = sorted(m for m in FORBIDDEN if m in modules)
+    startup = median(wall) - median(baseline)
+
+    print(f'lyrics -t (cache hit)  median {median(wall):7.1f} ms  '
+          f'interpreter {median(baseline):6.1f} ms  '
+          f'startup {startup:6.1f} ms  imports {total / 1000:6.1f} ms')
+    print(f'forbidden imports: {", ".join(forbidden) or "none"}')
+
+    ok = not forbidden and startup <= budget
+    if startup > budget:
+        print(f'over budget of {budget:.0f} ms')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,973 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from lyrics import CACHE_PATH
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks, writes are still atomic
+    fcntl = None
+
+# cache entry, lyrics -> list of lines
+Entry = namedtuple('Entry', ['key', 'track', 'album', 'source', 'lyrics',
+                             'fetched_at', 'updated_at'])
+
+# failed lookup, error -> error message or None if lyrics were not found,
+# count -> consecutive lookups that did not find lyrics, errors do not count
+Miss = namedtuple('Miss', ['key', 'count', 'last', 'error'])
+
+# eviction metadata of a cache entry, size in bytes
+Usage = namedtuple('Usage', ['key', 'size', 'accessed_at', 'hits'])
+
+DB_NAME = 'lyrics.db'
+MISSES_NAME = 'misses.json'
+ALIASES_NAME = 'aliases.json'
+ACCESS_NAME = 'access.json'
+
+# seconds a miss is trusted, doubled for each repeated miss of a track
+MISS_TTL = 3600
+MISS_TTL_MAX = 7 * 24 * 3600
+# seconds a lookup that failed with an error (offline, timeout) is trusted,
+# errors say nothing about the track, so they are retried soon
+ERROR_TTL = 60
+
+# seconds to wait for a write lock held by another process
+BUSY_TIMEOUT = 10
+
+# reads of an entry within this many seconds count as one access,
+# so replaying a track does not write to the cache on every read
+ACCESS_RESOLUTION = 3600
+
+# limits of cache, 0 -> unlimited, see configure()
+MAX_ENTRIES = 0
+MAX_BYTES = 0
+# 'lru' evicts least recently read entries, 'lfu' least often read ones
+EVICTION = 'lru'
+# eviction frees this fraction of a limit, so it does not run on every write
+EVICT_TO = 0.9
+
+# tracks cached before a compression dictionary is trained from them,
+# and most tracks it is trained from
+TRAIN_MIN = 200
+TRAIN_SAMPLES = 2000
+
+# seconds running totals of a FileStore are trusted, they do not see
+# writes of other processes sharing the cache until they are recounted
+TOTALS_INTERVAL = 600
+
+WRITE_LOCK_NAME = '.write.lock'
+
+# seconds a fetch waits for another process fetching the same track,
+# then it fetches on its own, and seconds between tries of the lock
+FETCH_LOCK_TIMEOUT = 5
+FETCH_LOCK_POLL = 0.05
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    ''' holds advisory flock on path (created if missing) for the block
+    '''
+    with open(path, 'a') as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def atomic_write(path, text):
+    ''' replaces file at path with text, readers see either old or new
+        content and a crash never leaves a torn file
+    '''
+    dirname = os.path.dirname(path)
+    # dot prefix keeps temp files out of FileStore.keys()
+    fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=dirname)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # persist the rename itself
+    dir_fd = os.open(dirname, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class LRUCache:
+    ''' bounded in-memory mapping, least recently used entries are evicted first
+    '''
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                self.data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return self.data[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, match):
+        ''' removes all entries for which match(key) is True
+        '''
+        with self.lock:
+            for key in [k for k in self.data if match(k)]:
+                del self.data[key]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        return {
+            'size': len(self.data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class FileStore:
+    ''' legacy cache backend, one plain text file per track in CACHE_PATH
+    '''
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        self.lock = threading.Lock()
+        self.misses_path = os.path.join(self.path, MISSES_NAME)
+        self.aliases_path = os.path.join(self.path, ALIASES_NAME)
+        self.access_path = os.path.join(self.path, ACCESS_NAME)
+        # serializes writers of all processes sharing path
+        self.lock_path = os.path.join(self.path, WRITE_LOCK_NAME)
+        # [entries, bytes, time counted] kept up to date by own writes
+        self.running_totals = None
+
+    def filepath(self, key):
+        ''' returns path of cache file of key,
+            raises ValueError if key can not name a file in self.path
+        '''
+        # cache files never contain dots, keys() would not list them
+        if not key or '.' in key or '/' in key or os.sep in key or '\0' in key:
+            raise ValueError(f'invalid cache key {key!r}')
+        return os.path.join(self.path, key)
+
+    def keys(self):
+        ''' returns keys of all cached tracks
+        '''
+        # cache files never contain dots, skip database and temp files
+        return [name for name in os.listdir(self.path)
+                if '.' not in name and os.path.isfile(self.filepath(name))]
+
+    def __contains__(self, key):
+        try:
+            return os.path.isfile(self.filepath(key))
+        except ValueError:
+            return False
+
+    def get(self, key, touch=True):
+        ''' returns Entry of cached lyrics or None if not cached
+            touch -> bool | whether the read counts as access for eviction
+        '''
+        try:
+            filepath = self.filepath(key)
+            with open(filepath, encoding='utf-8', errors='replace') as file:
+                lyrics = file.read().splitlines()
+            mtime = os.path.getmtime(filepath)
+        except (OSError, ValueError):
+            return None
+
+        if touch:
+            self.touch(key)
+        return Entry(key, None, None, None, lyrics, mtime, mtime)
+
+    def put(self, key, lyrics, track=None, album=None, source=None):
+        filepath = self.filepath(key)
+        text = ''.join(line + '\n' for line in lyrics)
+        with self.lock, file_lock(self.lock_path):
+            old_size = self.file_size(key)
+            atomic_write(filepath, text)
+            self.remove_miss(key)
+            self.add_totals(1 if old_size is None else 0, len(text.encode('utf-8')) - (old_size or 0))
+        evict(self)
+
+    def file_size(self, key):
+        try:
+            return os.stat(self.filepath(key)).st_size
+        except (OSError, ValueError):
+            return None
+
+    def add_totals(self, entries, size):
+        # caller holds self.lock
+        if self.running_totals is not None:
+            self.running_totals[0] += entries
+            self.running_totals[1] += size
+
+    def totals(self):
+        ''' returns (number of entries, bytes), as summed by usage()
+        '''
+        with self.lock:
+            totals = self.running_totals
+            if totals is not None and time.time() - totals[2] < TOTALS_INTERVAL:
+                return totals[0], totals[1]
+
+        sizes = [self.file_size(key) for key in self.keys()]
+        sizes = [size for size in sizes if size is not None]
+        with self.lock:
+            self.running_totals = [len(sizes), sum(sizes), time.time()]
+        return len(sizes), sum(sizes)
+
+    def load_access(self):
+        try:
+            with open(self.access_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def touch(self, key):
+        ''' records a read of entry, at most once per ACCESS_RESOLUTION
+        '''
+        if not limited():
+            return
+
+        now = time.time()
+        with self.lock:
+            access = self.load_access().get(key)
+        if access is not None and now - access[0] < ACCESS_RESOLUTION:
+            return
+
+        with self.lock, file_lock(self.lock_path):
+            accesses = self.load_access()
+            hits = accesses.get(key, [0, 1])[1]
+            accesses[key] = [now, hits + 1]
+            atomic_write(self.access_path, json.dumps(accesses))
+
+    def usage(self):
+        ''' returns list of Usage of all entries
+        '''
+        with self.lock:
+            accesses = self.load_access()
+
+        usage = []
+        for key in self.keys():
+            try:
+                st = os.stat(self.filepath(key))
+            except OSError:
+                continue
+            # writing an entry counts as its first read
+            accessed_at, hits = accesses.get(key, [st.st_mtime, 1])
+            usage.append(Usage(key, st.st_size, accessed_at, hits))
+        return usage
+
+    def delete(self, key):
+        ''' returns -> bool | whether the delete operation occured or not
+        '''
+        try:
+            with self.lock, file_lock(self.lock_path):
+                size = self.file_size(key) or 0
+                os.remove(self.filepath(key))
+                self.add_totals(-1, -size)
+                accesses = self.load_access()
+                if accesses.pop(key, None) is not None:
+                    atomic_write(self.access_path, json.dumps(accesses))
+        except (FileNotFoundError, ValueError):
+            return False
+        return True
+
+    def load_misses(self):
+        try:
+            with open(self.misses_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_misses(self, misses):
+        atomic_write(self.misses_path, json.dumps(misses))
+
+    def get_miss(self, key):
+        ''' returns Miss of track or None if it has no recorded miss
+        '''
+        with self.lock:
+            miss = self.load_misses().get(key)
+        return Miss(key, *miss) if miss else None
+
+    def misses(self):
+        with self.lock:
+            return [Miss(key, *miss) for key, miss in self.load_misses().items()]
+
+    def put_miss(self, key, error=None):
+        ''' records a failed lookup of track
+        '''
+        with self.lock, file_lock(self.lock_path):
+            misses = self.load_misses()
+            count = misses[key][0] if key in misses else 0
+            if error is None:
+                count += 1
+            misses[key] = [count, time.time(), error]
+            self.save_misses(misses)
+
+    def remove_miss(self, key):
+        # caller holds both locks
+        misses = self.load_misses()
+        if misses.pop(key, None) is not None:
+            self.save_misses(misses)
+
+    def clear_miss(self, key):
+        with self.lock, file_lock(self.lock_path):
+            self.remove_miss(key)
+
+    def load_aliases(self):
+        try:
+            with open(self.aliases_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def get_alias(self, alias):
+        ''' returns key of track alias points to, None if it is unknown
+        '''
+        with self.lock:
+            return self.load_aliases().get(alias)
+
+    def put_alias(self, alias, key):
+        with self.lock, file_lock(self.lock_path):
+            aliases = self.load_aliases()
+            if aliases.get(alias) != key:
+                aliases[alias] = key
+                atomic_write(self.aliases_path, json.dumps(aliases))
+
+    def aliases(self):
+        with self.lock:
+            return self.load_aliases()
+
+    def delete_alias(self, alias):
+        with self.lock, file_lock(self.lock_path):
+            aliases = self.load_aliases()
+            if aliases.pop(alias, None) is not None:
+                atomic_write(self.aliases_path, json.dumps(aliases))
+
+
+class SQLiteStore:
+    ''' indexed single-file cache backend, also keeps track metadata
+
+        legacy cache files present in path are imported once on first use
+
+        compression -> 'zlib' or 'zstd' to store lyrics compressed,
+                       records written before are still read as they are
+    '''
+
+    def __init__(self, path=CACHE_PATH, name=DB_NAME, compression=None):
+        self.path = path
+        self.compression = compression
+        self.codec = None
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(path, name),
+                                  check_same_thread=False,
+                                  timeout=BUSY_TIMEOUT)
+        self.create()
+        self.migrate()
+
+    def create(self):
+        with self.lock:
+            # readers in other processes (daemon, pagers) do not block writers
+            self.db.execute('PRAGMA journal_mode=WAL')
+
+        with self.lock, self.db:
+            self.db.executescript('''
+                CREATE TABLE IF NOT EXISTS lyrics (
+                    key TEXT PRIMARY KEY,
+                    track TEXT,
+                    album TEXT,
+                    source TEXT,
+                    lyrics TEXT NOT NULL,
+                    fetched_at REAL,
+                    updated_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS lyrics_track ON lyrics (track);
+                CREATE TABLE IF NOT EXISTS misses (
+                    key TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL,
+                    last REAL NOT NULL,
+                    error TEXT
+                );
+                CREATE TABLE IF NOT EXISTS dictionaries (
+                    id INTEGER PRIMARY KEY,
+                    algorithm TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    created_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS aliases (
+                    alias TEXT PRIMARY KEY,
+                    key TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    name TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            ''')
+            columns = [row[1] for row in self.db.execute('PRAGMA table_info(lyrics)')]
+            if 'codec' not in columns:
+                # NULL -> plain text lyrics
+                self.db.execute('ALTER TABLE lyrics ADD COLUMN codec TEXT')
+            if 'accessed_at' not in columns:
+                self.db.execute('ALTER TABLE lyrics ADD COLUMN accessed_at REAL')
+                self.db.execute('ALTER TABLE lyrics ADD COLUMN hits INTEGER NOT NULL DEFAULT 0')
+
+        # running totals checked on every write, summing the table is too slow
+        size = ("(length(CAST({0}.lyrics AS BLOB)) + length(coalesce({0}.track, ''))"
+                " + length(coalesce({0}.album, '')))")
+        with self.lock:
+            self.db.executescript(f'''
+                BEGIN IMMEDIATE;
+                CREATE TABLE IF NOT EXISTS totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    entries INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO totals
+                    SELECT 0, count(*), coalesce(sum({size.format('lyrics')}), 0) FROM lyrics;
+                CREATE TRIGGER IF NOT EXISTS totals_insert AFTER INSERT ON lyrics BEGIN
+                    UPDATE totals SET entries = entries + 1,
+                                      bytes = bytes + {size.format('NEW')};
+                END;
+                CREATE TRIGGER IF NOT EXISTS totals_update
+                AFTER UPDATE OF lyrics, track, album ON lyrics BEGIN
+                    UPDATE totals SET bytes = bytes + {size.format('NEW')} - {size.format('OLD')};
+                END;
+                CREATE TRIGGER IF NOT EXISTS totals_delete AFTER DELETE ON lyrics BEGIN
+                    UPDATE totals SET entries = entries - 1,
+                                      bytes = bytes - {size.format('OLD')};
+                END;
+                COMMIT;
+            ''')
+
+    def get_codec(self):
+        ''' returns Codec with dictionaries of this store, None until a
+            compressed record is read or written
+        '''
+        with self.lock:
+            if self.codec is None:
+                from lyrics.compress import Codec
+
+                self.codec = Codec()
+                self.load_dicts()
+        return self.codec
+
+    def load_dicts(self):
+        ''' adds dictionaries trained since codec last read them, also by
+            other processes sharing the store, self.lock must be held
+            returns number of added dictionaries
+        '''
+        rows = self.db.execute('''
+            SELECT id, algorithm, data FROM dictionaries WHERE id > ?''',
+            (self.codec.max_id(),)).fetchall()
+        for row in rows:
+            self.codec.add_dict(*row)
+        return len(rows)
+
+    def reload_dicts(self):
+        ''' returns True if dictionaries were trained since last read
+        '''
+        self.get_codec()
+        with self.lock:
+            return self.load_dicts() > 0
+
+    def encode(self, lyrics):
+        ''' returns (stored lyrics, codec name) of list of lines
+        '''
+        text = '\n'.join(lyrics)
+        if self.compression is None:
+            return text, None
+        return self.get_codec().compress(text, self.compression)
+
+    def decode(self, data, codec):
+        ''' returns list of lines of stored lyrics,
+            raises ValueError if they can not be decoded
+        '''
+        if codec is not None:
+            from lyrics.compress import UnknownDictionary
+
+            try:
+                data = self.get_codec().decompress(data, codec)
+            except UnknownDictionary:
+                # trained by another process after ours were read
+                if not self.reload_dicts():
+                    raise
+                data = self.codec.decompress(data, codec)
+        return data.split('\n')
+
+    def train(self):
+        ''' trains a compression dictionary from cached lyrics,
+            returns its id, None if compression is off
+        '''
+        if self.compression is None:
+            return None
+
+        from lyrics.compress import train
+
+        with self.lock:
+            rows = self.db.execute('''
+                SELECT lyrics, codec FROM lyrics
+                ORDER BY random() LIMIT ?''', (TRAIN_SAMPLES,)).fetchall()
+
+        samples = []
+        for data, codec in rows:
+            try:
+                samples.append('\n'.join(self.decode(data, codec)))
+            except ValueError:
+                pass
+        data = train(self.compression, samples)
+
+        codec = self.get_codec()
+        with self.lock, self.db:
+            dict_id = self.db.execute('''
+                INSERT INTO dictionaries (algorithm, data, created_at)
+                VALUES (?, ?, ?)''', (self.compression, data, time.time())).lastrowid
+        codec.add_dict(dict_id, self.compression, data)
+        return dict_id
+
+    def maybe_train(self):
+        ''' trains first dictionary once enough tracks are cached
+        '''
+        from lyrics.compress import BUILTIN_ID
+
+        if self.get_codec().latest(self.compression) != BUILTIN_ID:
+            return
+        with self.lock:
+            count = self.db.execute('SELECT count(*) FROM lyrics').fetchone()[0]
+        if count < TRAIN_MIN:
+            return
+        # another process may have trained it already
+        self.reload_dicts()
+        if self.codec.latest(self.compression) == BUILTIN_ID:
+            self.train()
+
+    def recompress(self, train=True):
+        ''' rewrites all lyrics with configured compression (or plain text
+            if it is off), with a newly trained dictionary if train is True
+            returns number of rewritten records
+        '''
+        if train:
+            self.train()
+
+        with self.lock:
+            if self.compression is None:
+                # plain text rows are already what they would be rewritten to
+                rows = self.db.execute('''SELECT key, lyrics, codec FROM lyrics
+                    WHERE codec IS NOT NULL''').fetchall()
+            else:
+                rows = self.db.execute('SELECT key, lyrics, codec FROM lyrics').fetchall()
+
+        updates = []
+        for key, data, codec in rows:
+            try:
+                updates.append((*self.encode(self.decode(data, codec)), key))
+            except ValueError:
+                pass
+
+        with self.lock, self.db:
+            self.db.executemany('UPDATE lyrics SET lyrics = ?, codec = ? WHERE key = ?',
+                                updates)
+        with self.lock:
+            self.db.execute('VACUUM')
+        return len(updates)
+
+    def get_meta(self, name):
+        with self.lock:
+            row = self.db.execute('SELECT value FROM meta WHERE name = ?',
+                                  (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name, value):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                            (name, value))
+
+    def migrate(self):
+        ''' imports one-file-per-track cache, only runs once
+        '''
+        if self.get_meta('migrated'):
+            return
+
+        legacy = FileStore(self.path)
+        rows = []
+        for key in legacy.keys():
+            entry = legacy.get(key, touch=False)
+            if entry is not None:
+                rows.append((key, '\n'.join(entry.lyrics),
+                             entry.fetched_at, entry.updated_at))
+
+        with self.lock, self.db:
+            self.db.executemany('''
+                INSERT OR IGNORE INTO lyrics (key, lyrics, fetched_at, updated_at)
+                VALUES (?, ?, ?, ?)''', rows)
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('migrated', ?)",
+                            (str(time.time()),))
+
+    def keys(self):
+        with self.lock:
+            return [row[0] for row in self.db.execute('SELECT key FROM lyrics')]
+
+    def __contains__(self, key):
+        with self.lock:
+            row = self.db.execute('SELECT 1 FROM lyrics WHERE key = ?',
+                                  (key,)).fetchone()
+        return row is not None
+
+    def get(self, key, touch=True):
+        with self.lock:
+            row = self.db.execute('''
+                SELECT key, track, album, source, lyrics, fetched_at, updated_at,
+                       codec, accessed_at
+                FROM lyrics WHERE key = ?''', (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        try:
+            lyrics = self.decode(row[4], row[7])
+        except ValueError:
+            # unreadable record is fetched again
+            return None
+
+        if touch and limited() and time.time() - (row[8] or 0) >= ACCESS_RESOLUTION:
+            self.touch(key)
+        return Entry(*row[:4], lyrics, *row[5:7])
+
+    def touch(self, key):
+        ''' records a read of entry
+        '''
+        with self.lock, self.db:
+            self.db.execute('''
+                UPDATE lyrics SET accessed_at = ?, hits = hits + 1
+                WHERE key = ?''', (time.time(), key))
+
+    def usage(self):
+        with self.lock:
+            rows = self.db.execute('''
+                SELECT key, length(CAST(lyrics AS BLOB)) + length(coalesce(track, ''))
+                       + length(coalesce(album, '')),
+                       coalesce(accessed_at, updated_at), hits
+                FROM lyrics''').fetchall()
+        return [Usage(*row) for row in rows]
+
+    def totals(self):
+        ''' returns (number of entries, bytes), as summed by usage()
+        '''
+        with self.lock:
+            return self.db.execute('SELECT entries, bytes FROM totals').fetchone()
+
+    def put(self, key, lyrics, track=None, album=None, source=None):
+        now = time.time()
+        if self.compression is not None:
+            self.maybe_train()
+        data, codec = self.encode(lyrics)
+
+        with self.lock, self.db:
+            self.db.execute('''
+                INSERT INTO lyrics
+                    (key, track, album, source, lyrics, fetched_at, updated_at, codec,
+                     accessed_at, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+                ON CONFLICT (key) DO UPDATE SET
+                    track = coalesce(excluded.track, track),
+                    album = coalesce(excluded.album, album),
+                    source = coalesce(excluded.source, source),
+                    lyrics = excluded.lyrics,
+                    codec = excluded.codec,
+                    updated_at = excluded.updated_at''',
+                (key, track, album, source, data, now, now, codec, now))
+            self.db.execute('DELETE FROM misses WHERE key = ?', (key,))
+        evict(self)
+
+    def delete(self, key):
+        with self.lock, self.db:
+            cursor = self.db.execute('DELETE FROM lyrics WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def get_miss(self, key):
+        with self.lock:
+            row = self.db.execute('''
+                SELECT key, count, last, error FROM misses WHERE key = ?''',
+                (key,)).fetchone()
+        return Miss(*row) if row else None
+
+    def misses(self):
+        with self.lock:
+            return [Miss(*row) for row in
+                    self.db.execute('SELECT key, count, last, error FROM misses')]
+
+    def put_miss(self, key, error=None):
+        with self.lock, self.db:
+            self.db.execute('''
+                INSERT INTO misses VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    count = count + excluded.count,
+                    last = excluded.last,
+                    error = excluded.error''',
+                (key, 0 if error else 1, time.time(), error))
+
+    def clear_miss(self, key):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM misses WHERE key = ?', (key,))
+
+    def get_alias(self, alias):
+        with self.lock:
+            row = self.db.execute('SELECT key FROM aliases WHERE alias = ?',
+                                  (alias,)).fetchone()
+        return row[0] if row else None
+
+    def put_alias(self, alias, key):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO aliases VALUES (?, ?)',
+                            (alias, key))
+
+    def aliases(self):
+        with self.lock:
+            return dict(self.db.execute('SELECT alias, key FROM aliases'))
+
+    def delete_alias(self, alias):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM aliases WHERE alias = ?', (alias,))
+
+
+BACKENDS = {
+    'sqlite': SQLiteStore,
+    'files': FileStore
+}
+
+backend = 'sqlite'
+# 'zlib' or 'zstd' compresses lyrics in the sqlite backend, None stores text
+compression = None
+store = None
+# recently read/written cache entries, saves disk reads on replay
+memory = LRUCache(maxsize=64)
+store_lock = threading.Lock()
+
+
+def configure(name=None, miss_ttl=None, compress=None,
+              max_entries=None, max_bytes=None, eviction=None):
+    ''' selects cache backend ('sqlite' or 'files'),
+        must be called before first get_store()
+
+        miss_ttl -> seconds before a failed lookup is retried
+        compress -> 'zlib', 'zstd' or 'off', compression of sqlite backend
+        max_entries, max_bytes -> cache limits, 0 for none
+        eviction -> 'lru' or 'lfu', which entries go first over a limit
+    '''
+    global backend, compression, MISS_TTL, MAX_ENTRIES, MAX_BYTES, EVICTION
+
+    if name is not None:
+        if name not in BACKENDS:
+            raise ValueError(f'unknown cache backend {name!r}')
+        backend = name
+
+    if compress is not None:
+        if compress == 'off':
+            compression = None
+        elif compress == 'zstd':
+            from lyrics.compress import available
+            # zstandard is optional, zlib is always there
+            compression = 'zstd' if available('zstd') else 'zlib'
+        elif compress == 'zlib':
+            compression = compress
+        else:
+            raise ValueError(f'unknown cache compression {compress!r}')
+
+    if miss_ttl is not None:
+        MISS_TTL = miss_ttl
+
+    if max_entries is not None:
+        MAX_ENTRIES = max(0, max_entries)
+    if max_bytes is not None:
+        MAX_BYTES = max(0, max_bytes)
+    if eviction is not None:
+        if eviction not in ('lru', 'lfu'):
+            raise ValueError(f'unknown cache eviction {eviction!r}')
+        EVICTION = eviction
+
+
+def limited():
+    ''' returns True if the cache has a size limit
+    '''
+    return MAX_ENTRIES > 0 or MAX_BYTES > 0
+
+
+def eviction_order(usage, policy=None):
+    ''' returns usage sorted by policy, entries to evict first
+    '''
+    if (policy or EVICTION) == 'lfu':
+        return sorted(usage, key=lambda u: (u.hits, u.accessed_at or 0))
+    return sorted(usage, key=lambda u: (u.accessed_at or 0, u.hits))
+
+
+def evict(store, max_entries=None, max_bytes=None, policy=None, dry_run=False):
+    ''' deletes entries of store by policy while it is over a limit,
+        down to EVICT_TO of it. limits default to configured ones
+
+        returns list of Usage of evicted entries
+    '''
+    max_entries = MAX_ENTRIES if max_entries is None else max_entries
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    if max_entries <= 0 and max_bytes <= 0:
+        return []
+
+    def under(entries, size):
+        return ((max_entries <= 0 or entries <= max_entries)
+                and (max_bytes <= 0 or size <= max_bytes))
+
+    # cheap check first, usage of every entry is only read over a limit
+    if under(*store.totals()):
+        return []
+    usage = store.usage()
+    entries = len(usage)
+    size = sum(u.size for u in usage)
+    if under(entries, size):
+        return []
+
+    target_entries = int(max_entries * EVICT_TO)
+    target_bytes = int(max_bytes * EVICT_TO)
+    evicted = []
+    for u in eviction_order(usage, policy):
+        if ((max_entries <= 0 or entries <= target_entries)
+                and (max_bytes <= 0 or size <= target_bytes)):
+            break
+        if dry_run or store.delete(u.key):
+            evicted.append(u)
+        entries -= 1
+        size -= u.size
+
+    evicted_keys = {u.key for u in evicted}
+    memory.invalidate(lambda k: k in evicted_keys)
+    return evicted
+
+
+def miss_expired(miss):
+    ''' returns True if a recorded miss is old enough to be retried,
+        ttl grows exponentially with number of consecutive misses,
+        errors are retried after ERROR_TTL
+    '''
+    if miss.error:
+        ttl = ERROR_TTL
+    else:
+        ttl = min(MISS_TTL * 2 ** (max(miss.count, 1) - 1), MISS_TTL_MAX)
+    return time.time() - miss.last >= ttl
+
+
+@contextmanager
+def fetch_lock(key, source='any', cancel=None, timeout=None):
+    ''' held while lyrics of track key are fetched from source, so that
+        processes sharing the cache fetch a track only once. every track
+        has its own lock file, removed when the lock is released
+
+        waiting stops after timeout seconds (FETCH_LOCK_TIMEOUT) or once
+        cancel (threading.Event) is set, the block then runs without the
+        lock. yields True if the lock is held
+    '''
+    timeout = FETCH_LOCK_TIMEOUT if timeout is None else timeout
+    name = hashlib.sha1(f'{key}\0{source}'.encode('utf-8')).hexdigest()[:16]
+    path = os.path.join(get_store().path, f'.fetch-{name}.lock')
+    if fcntl is None:
+        yield False
+        return
+
+    deadline = time.monotonic() + timeout
+    file = None
+    while True:
+        file = open(path, 'a')
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # a holder removes the file before unlocking it, whoever
+            # waited on the removed file locks the new one instead
+            if os.stat(path).st_ino == os.fstat(file.fileno()).st_ino:
+                break
+        except (BlockingIOError, FileNotFoundError):
+            pass
+        file.close()
+        file = None
+
+        if (cancel is not None and cancel.is_set()) or time.monotonic() >= deadline:
+            break
+        if cancel is not None:
+            cancel.wait(FETCH_LOCK_POLL)
+        else:
+            time.sleep(FETCH_LOCK_POLL)
+
+    if file is None:
+        yield False
+        return
+
+    try:
+        yield True
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        file.close()
+
+
+def get_store():
+    ''' returns shared store of configured cache backend
+    '''
+    global store
+
+    with store_lock:
+        if store is None:
+            if backend == 'sqlite':
+                store = SQLiteStore(compression=compression)
+            else:
+                store = BACKENDS[backend]()
+    return store
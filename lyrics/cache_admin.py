@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+''' lyrics cache maintenance
+
+    lyrics cache stats
+    lyrics cache verify [--fix]
+    lyrics cache prune [--max-entries N] [--max-mb MB] [--policy lru|lfu] [--dry-run]
+    lyrics cache export FILE
+    lyrics cache import [--replace] FILE
+    lyrics cache rebuild-index
+
+    export and import use JSON lines, one cache entry per line,
+    FILE '-' is stdout/stdin
+'''
+from lyrics import cache
+from lyrics import util
+
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def format_size(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
+
+
+def format_limit(limit, size=False):
+    if limit <= 0:
+        return 'unlimited'
+    return format_size(limit) if size else str(limit)
+
+
+def disk_usage(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.stat(os.path.join(root, name)).st_blocks * 512
+            except OSError:
+                pass
+    return total
+
+
+def stats(store, args, out):
+    usage = store.usage()
+    misses = store.misses()
+    expired = sum(1 for miss in misses if cache.miss_expired(miss))
+
+    print(f'backend      {cache.backend} ({store.path})', file=out)
+    if isinstance(store, cache.SQLiteStore):
+        print(f'compression  {store.compression or "off"}', file=out)
+    print(f'entries      {len(usage)} (limit {format_limit(cache.MAX_ENTRIES)})', file=out)
+    print(f'lyrics       {format_size(sum(u.size for u in usage))} '
+          f'(limit {format_limit(cache.MAX_BYTES, size=True)})', file=out)
+    print(f'on disk      {format_size(disk_usage(store.path))}', file=out)
+    print(f'misses       {len(misses)} ({expired} expired)', file=out)
+    print(f'aliases      {len(store.aliases())}', file=out)
+    print(f'eviction     {cache.EVICTION}', file=out)
+
+    if usage:
+        oldest = min(u.accessed_at or 0 for u in usage)
+        days = (time.time() - oldest) / 86400
+        print(f'oldest read  {days:.0f} days ago', file=out)
+    return 0
+
+
+def verify(store, args, out):
+    ''' reads every entry back, reports (and with --fix deletes)
+        those that can not be read
+    '''
+    broken = []
+    if isinstance(store, cache.SQLiteStore):
+        with store.lock:
+            result = store.db.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            print(f'database: {result}', file=out)
+            broken.append(None)
+
+    keys = store.keys()
+    for key in keys:
+        try:
+            entry = store.get(key, touch=False)
+        except (OSError, ValueError):
+            entry = None
+        if entry is None:
+            print(f'unreadable: {key}', file=out)
+            broken.append(key)
+
+    aliases = store.aliases()
+    dangling = [alias for alias, key in aliases.items() if key not in store]
+    for alias in dangling:
+        print(f'dangling alias: {alias}', file=out)
+
+    if args.fix:
+        for key in broken:
+            if key is not None:
+                store.delete(key)
+        for alias in dangling:
+            store.delete_alias(alias)
+
+    print(f'{len(keys)} entries, {len([k for k in broken if k])} unreadable, '
+          f'{len(dangling)} dangling aliases' + (', fixed' if args.fix else ''), file=out)
+    return 1 if (broken or dangling) and not args.fix else 0
+
+
+def prune(store, args, out):
+    ''' evicts entries over limits, drops expired misses and dangling aliases
+    '''
+    max_entries = cache.MAX_ENTRIES if args.max_entries is None else args.max_entries
+    max_bytes = cache.MAX_BYTES if args.max_mb is None else int(args.max_mb * 1024 * 1024)
+
+    evicted = cache.evict(store, max_entries, max_bytes, args.policy, args.dry_run)
+    for u in evicted:
+        print(f'evict {u.key} ({format_size(u.size)}, {u.hits} reads)', file=out)
+
+    expired = [miss for miss in store.misses()
+               if time.time() - miss.last >= cache.MISS_TTL_MAX]
+    aliases = store.aliases()
+    dangling = [alias for alias, key in aliases.items() if key not in store]
+
+    if not args.dry_run:
+        for miss in expired:
+            store.clear_miss(miss.key)
+        for alias in dangling:
+            store.delete_alias(alias)
+
+    print(f'{"would remove" if args.dry_run else "removed"} {len(evicted)} entries '
+          f'({format_size(sum(u.size for u in evicted))}), {len(expired)} old misses, '
+          f'{len(dangling)} dangling aliases', file=out)
+    return 0
+
+
+def export(store, args, out):
+    file = sys.stdout if args.file == '-' else open(args.file, 'w', encoding='utf-8')
+    count = 0
+    try:
+        for key in store.keys():
+            entry = store.get(key, touch=False)
+            if entry is None:
+                continue
+            file.write(json.dumps(entry._asdict(), ensure_ascii=False) + '\n')
+            count += 1
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+    print(f'exported {count} entries', file=out)
+    return 0
+
+
+def import_(store, args, out):
+    file = sys.stdin if args.file == '-' else open(args.file, encoding='utf-8')
+    imported = skipped = 0
+    try:
+        for num, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                key, lyrics = data['key'], data['lyrics']
+                valid = (isinstance(key, str) and key and isinstance(lyrics, list)
+                         and all(isinstance(l, str) for l in lyrics))
+            except (ValueError, KeyError, TypeError):
+                valid = False
+            if not valid:
+                print(f'line {num}: not a cache entry', file=out)
+                return 1
+
+            if not args.replace and key in store:
+                skipped += 1
+                continue
+            try:
+                store.put(key, lyrics, track=data.get('track'), album=data.get('album'),
+                          source=data.get('source'))
+            except ValueError as e:
+                # key naming a path outside of the file cache
+                print(f'line {num}: {e}', file=out)
+                return 1
+            if data.get('track'):
+                # entries of older versions are found under canonical keys too
+                canonical = util.get_key(data['track'])
+                if canonical != key:
+                    store.put_alias(canonical, key)
+            imported += 1
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+    cache.memory.clear()
+    print(f'imported {imported} entries, {skipped} already cached', file=out)
+    return 0
+
+
+def rebuild_index(store, args, out, defaults):
+    ''' rebuilds what is derived from cached entries: aliases of canonical
+        keys, sqlite indexes and compression dictionary, local music index
+    '''
+    aliases = 0
+    for key in store.keys():
+        entry = store.get(key, touch=False)
+        if entry is None or not entry.track:
+            continue
+        canonical = util.get_key(entry.track)
+        if canonical != key and canonical not in store:
+            store.put_alias(canonical, key)
+            aliases += 1
+    print(f'aliases: {aliases} canonical keys added', file=out)
+
+    if isinstance(store, cache.SQLiteStore):
+        with store.lock:
+            store.db.execute('REINDEX')
+        # with compression off, compressed entries are stored as plain text,
+        # recompress vacuums the database too
+        count = store.recompress()
+        if store.compression is not None:
+            print(f'compression: {count} entries recompressed', file=out)
+        else:
+            print(f'compression: {count} entries decompressed', file=out)
+        print('database: reindexed', file=out)
+
+    from lyrics import local
+    index = local.get_index(defaults.get('music_dir', ''))
+    if index is not None:
+        index.scan()
+        print(f'music index: {len(index.keys)} tracks in {index.music_dir}', file=out)
+
+    cache.memory.clear()
+    return 0
+
+
+def main(argv, defaults, out=sys.stdout):
+    parser = argparse.ArgumentParser(prog='lyrics cache',
+                                     description='Inspect and maintain the lyrics cache.')
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    actions.add_parser('stats', help='size, limits and contents of cache')
+
+    p = actions.add_parser('verify', help='check that every entry can be read')
+    p.add_argument('--fix', action='store_true',
+                   help='delete unreadable entries and dangling aliases')
+
+    p = actions.add_parser('prune', help='evict entries over limits, drop old misses')
+    p.add_argument('--max-entries', type=int, help='entry limit (default from lyrics.cfg)')
+    p.add_argument('--max-mb', type=float, help='size limit in MiB (default from lyrics.cfg)')
+    p.add_argument('--policy', choices=('lru', 'lfu'), help='eviction policy')
+    p.add_argument('--dry-run', action='store_true', help='only list what would be removed')
+
+    p = actions.add_parser('export', help='write entries as JSON lines')
+    p.add_argument('file', help="output file, '-' for stdout")
+
+    p = actions.add_parser('import', help='read entries written by export')
+    p.add_argument('file', help="input file, '-' for stdin")
+    p.add_argument('--replace', action='store_true', help='overwrite cached entries')
+
+    actions.add_parser('rebuild-index', help='rebuild aliases, indexes and music index')
+
+    args = parser.parse_args(argv)
+    store = cache.get_store()
+    # export writes entries to stdout, reports go to stderr then
+    report = sys.stderr if getattr(args, 'file', None) == '-' else out
+
+    if args.action == 'stats':
+        return stats(store, args, report)
+    if args.action == 'verify':
+        return verify(store, args, report)
+    if args.action == 'prune':
+        return prune(store, args, report)
+    if args.action == 'export':
+        return export(store, args, report)
+    if args.action == 'import':
+        return import_(store, args, report)
+    return rebuild_index(store, args, report, defaults)
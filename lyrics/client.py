@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from urllib.parse import urlencode
+from lyrics import CACHE_PATH
+from lyrics.track import Track, FETCHING_TEXT
+
+import http.client
+import json
+import os
+import socket
+import threading
+import time
+
+# seconds a long-poll waits at the daemon before it is repeated
+LONG_POLL = 30
+# seconds between reconnect attempts, doubled after every failure
+BACKOFF_MIN = 1
+BACKOFF_MAX = 30
+
+
+def socket_path():
+    ''' returns default path of lyrics daemon unix socket
+    '''
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'lyrics-in-terminal.sock')
+    return os.path.join(CACHE_PATH, 'daemon.sock')
+
+
+class DaemonError(Exception):
+    pass
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class DaemonClient:
+    ''' client of lyrics daemon HTTP API on its unix socket
+    '''
+
+    def __init__(self, path=None):
+        self.path = path or socket_path()
+
+    def request(self, method, url, body=None, timeout=5):
+        ''' returns decoded JSON response,
+            raises OSError if daemon is not reachable
+        '''
+        conn = UnixHTTPConnection(self.path, timeout)
+        try:
+            headers = {}
+            if body is not None:
+                body = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            conn.request(method, url, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = json.loads(resp.read().decode('utf-8'))
+        except (http.client.HTTPException, ValueError) as e:
+            raise DaemonError(str(e))
+        finally:
+            conn.close()
+
+        if resp.status >= 400:
+            raise DaemonError(data.get('error', resp.reason))
+        return data
+
+    def current(self, since=None, timeout=LONG_POLL):
+        ''' returns current player state, waits up to timeout seconds
+            for a state newer than version since
+        '''
+        if since is None:
+            return self.request('GET', '/current')
+        query = urlencode({'since': since, 'timeout': timeout})
+        return self.request('GET', '/current?' + query, timeout=timeout + 5)
+
+    def lyrics(self, track_name):
+        query = urlencode({'track': track_name})
+        return self.request('GET', '/lyrics?' + query, timeout=60)
+
+    def refresh(self, cycle_source=False, source=None, cache=True):
+        return self.request('POST', '/refresh', {'cycle_source': cycle_source,
+                                                 'source': source, 'cache': cache})
+
+    def set_autoswitch(self, autoswitch):
+        return self.request('POST', '/autoswitch', {'autoswitch': autoswitch})
+
+
+class RemotePlayer:
+    ''' player followed by a lyrics daemon, used by Window in place of
+        lyrics.player.Player
+
+        daemon pushes its state to a long-poll thread, update() and
+        fetch() only apply the latest state
+    '''
+    # every change arrives as an event
+    events = True
+
+    def __init__(self, client, align=1):
+        self.client = client
+        self.track = Track(align=align)
+        self.player_name = 'daemon'
+        self.running = False
+        self.remote_autoswitch = False
+        self.player_priority = []
+        self.lookahead = 0
+
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        self.callbacks = []
+        # (lyrics, source) last set on track
+        self.applied = None
+
+        # raises OSError if daemon is not running
+        self.set_state(client.current())
+        self.update()
+        self.fetch()
+
+        self.thread = threading.Thread(target=self.run, name='lyrics-client',
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self):
+        backoff = BACKOFF_MIN
+        while True:
+            try:
+                state = self.client.current(self.state['version'])
+                backoff = BACKOFF_MIN
+            except (OSError, DaemonError):
+                # daemon went away, retry until it is back
+                state = {'version': 0, 'running': False,
+                         'player': 'lyrics daemon'}
+                self.set_state(state)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, BACKOFF_MAX)
+                continue
+
+            if state['version'] != self.state['version']:
+                self.set_state(state)
+
+    def set_state(self, state):
+        with self.lock:
+            self.state = state
+            self.received_at = time.monotonic()
+        self.changed.set()
+        for callback in self.callbacks:
+            callback()
+
+    def add_callback(self, callback):
+        ''' callback() is called from client thread on every change
+        '''
+        self.callbacks.append(callback)
+
+    @property
+    def autoswitch(self):
+        return self.remote_autoswitch
+
+    @autoswitch.setter
+    def autoswitch(self, autoswitch):
+        self.remote_autoswitch = autoswitch
+        try:
+            self.client.set_autoswitch(autoswitch)
+        except (OSError, DaemonError):
+            pass
+
+    def update(self):
+        ''' applies latest daemon state
+            returns -> bool | whether track changed
+        '''
+        if not self.changed.is_set():
+            return False
+        self.changed.clear()
+
+        with self.lock:
+            state = self.state
+
+        self.running = state['running']
+        self.player_name = state.get('player') or self.player_name
+        self.remote_autoswitch = state.get('autoswitch', self.remote_autoswitch)
+
+        if not self.running or state.get('trackid') == self.track.trackid:
+            return False
+
+        self.track.update(state['artist'], state['title'], state['album'],
+                          state['trackid'])
+        self.applied = None
+        self.fetch()
+        return True
+
+    @property
+    def fetching(self):
+        return self.state.get('fetching', False)
+
+    def fetch(self):
+        ''' swaps in lyrics sent by daemon
+            returns -> bool | whether track lyrics were updated
+        '''
+        with self.lock:
+            state = self.state
+
+        if not state['running'] or state.get('trackid') != self.track.trackid:
+            return False
+
+        lyrics = (state.get('lyrics') or [FETCHING_TEXT], state.get('source'))
+        if lyrics == self.applied:
+            return False
+
+        self.applied = lyrics
+        self.track.set_lyrics(*lyrics)
+        return True
+
+    def refresh(self, cycle_source=False, source=None, cache=True):
+        ''' asks daemon to fetch lyrics of current track again
+        '''
+        self.track.set_fetching()
+        self.applied = None
+        try:
+            self.client.refresh(cycle_source, source, cache)
+        except (OSError, DaemonError):
+            pass
+
+    def position(self):
+        ''' returns (playback position in ms, playing) extrapolated
+            from last state
+        '''
+        with self.lock:
+            state, received_at = self.state, self.received_at
+
+        position = state.get('position')
+        if position is None:
+            return None, False
+
+        playing = state.get('playing', False)
+        if playing:
+            position += (time.monotonic() - received_at) * 1000
+        return int(position), playing
+
+
+def connect(align=1, path=None):
+    ''' returns RemotePlayer of running daemon, None if there is none
+    '''
+    client = DaemonClient(path)
+    if not os.path.exists(client.path):
+        return None
+
+    try:
+        return RemotePlayer(client, align)
+    except (OSError, DaemonError):
+        return None
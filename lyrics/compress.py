@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+''' compression of cached lyrics
+
+    lyrics are short and repetitive across tracks, so every record is
+    compressed against a preset dictionary: a built-in one until the
+    cache has enough tracks to train one from its own lyrics
+
+    records carry the name of their codec, 'zlib:ID' or 'zstd:ID',
+    ID 0 is BUILTIN_DICT, others are trained dictionaries kept by the store
+'''
+from collections import Counter
+
+import re
+import threading
+import zlib
+
+ALGORITHMS = ('zlib', 'zstd')
+BUILTIN_ID = 0
+
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 9
+# zlib only looks back 32 KiB
+ZLIB_DICT_SIZE = 32 * 1024
+ZSTD_DICT_SIZE = 64 * 1024
+
+WORD_REGEX = re.compile(r"[\w'’]+")
+
+# never change, records compressed with it are decoded with it,
+# most frequent text last, nearest to the compressed data
+BUILTIN_DICT = ('''\
+[Instrumental]
+[Refrain]
+[Interlude]
+[Outro]
+[Intro]
+[Bridge]
+[Pre-Chorus]
+[Verse 3]
+[Verse 2]
+[Verse 1]
+[Chorus]
+ooh ah whoa hey la na da
+every never ever forever always tonight together nothing something
+heart world life night time day way away baby girl boy man
+feel need want know think say tell take make give come go see look
+I'll I've you're you'll we're they're it's that's can't won't ain't
+I'm gonna wanna gotta don't
+where when what how why who this that there they them their
+with from just like love yeah oh no
+in the on the to the of the and the
+I don't know
+you and me
+me you my your we our it is in to and the a I
+''').encode('utf-8')
+
+
+def zstd():
+    ''' returns zstandard module, None if it is not installed
+    '''
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def available(algorithm):
+    if algorithm == 'zstd':
+        return zstd() is not None
+    return algorithm in ALGORITHMS
+
+
+def train(algorithm, samples):
+    ''' returns dictionary trained from sample lyrics texts
+    '''
+    if algorithm == 'zstd':
+        zstandard = zstd()
+        try:
+            trained = zstandard.train_dictionary(
+                ZSTD_DICT_SIZE, [text.encode('utf-8') for text in samples])
+            return trained.as_bytes()
+        except zstandard.ZstdError:
+            # too few samples, fall back to a raw content dictionary
+            pass
+
+    # words and word pairs found in most tracks
+    counts = Counter()
+    for text in samples:
+        words = WORD_REGEX.findall(text)
+        counts.update(set(words))
+        counts.update(set(' '.join(pair) for pair in zip(words, words[1:])))
+
+    size = ZLIB_DICT_SIZE - len(BUILTIN_DICT)
+    picked = []
+    for text, count in counts.most_common():
+        if count < 2:
+            break
+        size -= len(text.encode('utf-8')) + 1
+        if size < 0:
+            break
+        picked.append(text)
+
+    return BUILTIN_DICT + '\n'.join(reversed(picked)).encode('utf-8')
+
+
+class UnknownDictionary(ValueError):
+    ''' record names a dictionary the codec does not have (yet),
+        another process sharing the store may have trained it
+    '''
+
+
+class Codec:
+    ''' compresses and decompresses records with the dictionaries of a store
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # id -> (algorithm, dictionary)
+        self.dicts = {BUILTIN_ID: (None, BUILTIN_DICT)}
+        # (id, 'c' or 'd') -> zstd compressor/decompressor, they are reused
+        self.zstd_objects = {}
+
+    def add_dict(self, dict_id, algorithm, data):
+        with self.lock:
+            self.dicts[dict_id] = (algorithm, data)
+
+    def __contains__(self, dict_id):
+        with self.lock:
+            return dict_id in self.dicts
+
+    def max_id(self):
+        with self.lock:
+            return max(self.dicts)
+
+    def latest(self, algorithm):
+        ''' returns id of newest dictionary of algorithm
+        '''
+        with self.lock:
+            ids = [i for i, (a, _) in self.dicts.items() if a == algorithm]
+        return max(ids, default=BUILTIN_ID)
+
+    def zstd_dict(self, dict_id):
+        zstandard = zstd()
+        algorithm, data = self.dicts[dict_id]
+        if algorithm == 'zstd':
+            return zstandard.ZstdCompressionDict(data)
+        return zstandard.ZstdCompressionDict(data, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+    def compress(self, text, algorithm):
+        ''' returns (compressed bytes, codec name)
+        '''
+        dict_id = self.latest(algorithm)
+        data = text.encode('utf-8')
+
+        if algorithm == 'zstd':
+            with self.lock:
+                key = (dict_id, 'c')
+                if key not in self.zstd_objects:
+                    self.zstd_objects[key] = zstd().ZstdCompressor(
+                        level=ZSTD_LEVEL, dict_data=self.zstd_dict(dict_id))
+                return self.zstd_objects[key].compress(data), f'zstd:{dict_id}'
+
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15,
+                                      zdict=self.dicts[dict_id][1][-ZLIB_DICT_SIZE:])
+        return compressor.compress(data) + compressor.flush(), f'zlib:{dict_id}'
+
+    def decompress(self, data, codec):
+        ''' returns text of record compressed with codec,
+            raises ValueError if it can not be decoded
+        '''
+        algorithm, _, dict_id = codec.partition(':')
+        dict_id = int(dict_id or BUILTIN_ID)
+        if dict_id not in self:
+            raise UnknownDictionary(f'unknown dictionary {dict_id}')
+
+        try:
+            if algorithm == 'zstd':
+                if zstd() is None:
+                    raise ValueError('zstandard is not installed')
+                with self.lock:
+                    key = (dict_id, 'd')
+                    if key not in self.zstd_objects:
+                        self.zstd_objects[key] = zstd().ZstdDecompressor(
+                            dict_data=self.zstd_dict(dict_id))
+                    try:
+                        data = self.zstd_objects[key].decompress(data)
+                    except zstd().ZstdError as e:
+                        raise ValueError(str(e))
+            elif algorithm == 'zlib':
+                decompressor = zlib.decompressobj(-15, zdict=self.dicts[dict_id][1][-ZLIB_DICT_SIZE:])
+                data = decompressor.decompress(data) + decompressor.flush()
+            else:
+                raise ValueError(f'unknown codec {codec!r}')
+        except zlib.error as e:
+            raise ValueError(str(e))
+
+        return data.decode('utf-8')
@@ -3,24 +3,209 @@
 from lyrics import CONFIG_PATH
 from configparser import ConfigParser
 
-import curses
+import os
+import threading
 
+INOTIFY_ENABLED = False
+
+try:
+    # making inotify_simple an optional dependency, mtime is polled without it
+    from inotify_simple import INotify, flags
+    INOTIFY_ENABLED = True
+except ImportError:
+    pass
+
+BOOLEAN_STATES = ConfigParser.BOOLEAN_STATES
+
+# curses key constants, curses is only imported if a binding uses one
 KEYS={
-    'arrow_up': curses.KEY_UP,
-    'arrow_down': curses.KEY_DOWN,
-    'arrow_left': curses.KEY_LEFT,
-    'arrow_right': curses.KEY_RIGHT
+    'arrow_up': 'KEY_UP',
+    'arrow_down': 'KEY_DOWN',
+    'arrow_left': 'KEY_LEFT',
+    'arrow_right': 'KEY_RIGHT'
 }
 
+
+def ensure_config(config_path=CONFIG_PATH):
+    ''' copies default config to config_path if there is none yet
+    '''
+    if config_path.exists():
+        return
+
+    from shutil import copy
+
+    src = os.path.join(os.path.dirname(__file__), 'lyrics.cfg')
+    os.makedirs(config_path.parent, exist_ok=True)
+    copy(src, config_path)
+
+
+class ConfigFile:
+    ''' lyrics.cfg parsed once and shared by all Config sections
+
+        reparsed only after the file changed, which is noticed from
+        inotify events if inotify_simple is installed, otherwise from
+        the file's mtime when poll() is called
+    '''
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.parser = ConfigParser()
+        self.mtime = None
+        # incremented on every parse, Config sections convert values again
+        self.version = 0
+
+        self.changed = threading.Event()
+        self.callbacks = []
+        self.watcher = None
+
+        self.load()
+
+    def stat(self):
+        try:
+            return os.stat(self.filepath).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self):
+        ''' parses file, returns False if it did not parse
+            and the previous config was kept
+        '''
+        ensure_config(self.filepath)
+
+        default_path = os.path.join(os.path.dirname(__file__), 'lyrics.cfg')
+        # taken before reading, a write while parsing is noticed next poll
+        mtime = self.stat()
+        parser = ConfigParser()
+        try:
+            # keys added after the user's copy was made keep their defaults
+            parser.read([default_path, self.filepath])
+        except Exception as e:
+            # keep previous config if new one does not parse,
+            # it is parsed again once the file changes, not on every poll
+            if self.version > 0:
+                with self.lock:
+                    self.mtime = mtime
+                return False
+            # use default config
+            parser = ConfigParser()
+            parser.read(default_path)
+
+        with self.lock:
+            self.parser = parser
+            self.mtime = mtime
+            self.version += 1
+        return True
+
+    def section(self, section):
+        with self.lock:
+            return self.version, dict(self.parser.items(section))
+
+    def add_callback(self, callback):
+        ''' callback() is called from watcher thread when file changes,
+            starts the inotify watcher on first call
+        '''
+        self.callbacks.append(callback)
+        if self.watcher is None and INOTIFY_ENABLED:
+            self.watcher = threading.Thread(target=self.watch, name='lyrics-config',
+                                            daemon=True)
+            self.watcher.start()
+
+    def watch(self):
+        # editors often replace the file, so its directory is watched
+        inotify = INotify()
+        mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE
+        inotify.add_watch(str(self.filepath.parent), mask)
+
+        while True:
+            for event in inotify.read():
+                if event.name == self.filepath.name:
+                    self.changed.set()
+                    for callback in self.callbacks:
+                        callback()
+                    break
+
+    def poll(self):
+        ''' reparses file if it changed since last parse,
+            returns True if it was reloaded
+        '''
+        if self.watcher is not None:
+            if not self.changed.is_set():
+                return False
+            self.changed.clear()
+
+        mtime = self.stat()
+        if mtime is None or mtime == self.mtime:
+            return False
+
+        return self.load()
+
+
+# path -> ConfigFile
+files = {}
+files_lock = threading.Lock()
+
+
+def get_file(config_path=CONFIG_PATH):
+    ''' returns shared parsed config file of config_path
+    '''
+    with files_lock:
+        config_file = files.get(config_path)
+        if config_file is None:
+            config_file = files[config_path] = ConfigFile(config_path)
+    return config_file
+
+
+def alignment(align):
+    ''' returns Track alignment of alignment option
+    '''
+    if align == 'center':
+        return 0
+    elif align == 'right':
+        return 2
+    return 1
+
+def parse_value(value):
+    ''' converts config value to curses key, int or ascii code,
+        other values are returned as they are
+    '''
+    if value in KEYS.keys():
+        import curses
+        return getattr(curses, KEYS[value])
+    try:
+        return int(value)
+    except ValueError:
+        # not integer
+        # change to ascii
+        if len(value) == 1:
+            return ord(value)
+    return value
+
+
 class Config:
-    def __init__(self, section, config_path=CONFIG_PATH):
-        self.dict = {}
+    ''' one section of the shared config file, values follow
+        reloads of the file
+    '''
 
+    def __init__(self, section, config_path=CONFIG_PATH):
+        self.file = get_file(config_path)
         self.filepath = config_path
         self.section = section
 
-        self.load()
-        self.set_constants()
+        self.version = None
+        self.raw = {}
+        self.values = {}
+
+    def refresh(self):
+        # values are converted again only after file was reparsed
+        if self.version != self.file.version:
+            self.version, self.raw = self.file.section(self.section)
+            self.values = {k: parse_value(v) for k, v in self.raw.items()}
+
+    @property
+    def dict(self):
+        self.refresh()
+        return self.values
 
     def __setitem__(self, key, value):
         self.dict[key] = value
@@ -36,41 +221,47 @@ class Config:
 
     def items(self):
         return [(k, v) for k,v in self.dict.items()]
-    
-    def getboolean(self, entry):
+
+    def get(self, key, fallback=None):
+        ''' returns raw string value of key
+        '''
+        self.refresh()
+        return self.raw.get(key, fallback)
+
+    def getint(self, key, fallback=0):
         try:
-            config = ConfigParser()
-            config.read(self.filepath)
-            return config[self.section].getboolean(entry)
-        except Exception as e:
-            pass
+            return int(self.get(key))
+        except (TypeError, ValueError):
+            return fallback
 
-    def load(self):
+    def getfloat(self, key, fallback=0.0):
         try:
-            config = ConfigParser()
-            config.read(self.filepath)
-        except Exception as e:
-            pass
-            # use default config
+            return float(self.get(key))
+        except (TypeError, ValueError):
+            return fallback
+
+    def getboolean(self, key, fallback=None):
+        value = self.get(key)
+        if value is None:
+            return fallback
+        return BOOLEAN_STATES.get(value.strip().lower(), fallback)
+
+    def getlist(self, key, fallback=None):
+        ''' returns comma separated value as list of non-empty strings
+        '''
+        value = self.get(key)
+        if value is None:
+            return fallback
+        return [v.strip() for v in value.split(',') if v.strip()]
+
+    def poll(self):
+        ''' reloads config file if it changed, returns True if it did
+        '''
+        return self.file.poll()
+
+    def add_callback(self, callback):
+        self.file.add_callback(callback)
 
-        conf = dict(config.items(self.section))
-        assert isinstance(conf, dict)
-
-        self.dict = conf
-
-    def set_constants(self):
-        for key, value in self.dict.items():
-            if value in KEYS.keys():
-                self.dict[key] = KEYS[value]
-            else:
-                try:
-                    value = int(value)
-                    self.dict[key] = value
-                except ValueError:
-                    # not integer
-                    # change to ascii
-                    if len(value) == 1:
-                        self.dict[key] = ord(value)
     '''
     def save(self):
         config = ConfigParser()
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+''' headless lyrics daemon
+
+    lyrics daemon [--socket PATH] [--port PORT] [--player NAME]
+
+    follows the player, fetches lyrics and owns the cache, pagers and
+    scripts read lyrics from its HTTP API on a unix socket (and with
+    --port on 127.0.0.1)
+
+    any local user can connect to the port, its requests need the header
+    'Authorization: Bearer TOKEN' with the token the daemon writes next
+    to the socket (PATH with .token instead of .sock)
+
+    GET  /current                        current player, track and lyrics
+    GET  /current?since=VERSION          long-poll, waits until state is
+                                         newer than VERSION (timeout=SECONDS)
+    GET  /events                         server-sent events of state changes
+    GET  /lyrics?track=ARTIST - TITLE    lyrics of any track
+    GET  /providers                      latency and success stats of sources
+    POST /refresh     {"source": ..., "cycle_source": ..., "cache": ...}
+    POST /autoswitch  {"autoswitch": true|false}
+'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from lyrics import __version__
+from lyrics import cache as lyrics_cache
+from lyrics import util
+from lyrics.client import socket_path, LONG_POLL
+from lyrics.scheduler import Scheduler, POLL_MAX
+
+import argparse
+import hmac
+import json
+import os
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+# longest wait of a long-poll request, seconds
+LONG_POLL_MAX = 120
+# seconds between keep-alive comments on event streams
+KEEPALIVE = 15
+# ms the player's position may differ from the extrapolated one
+# before it is published again, larger differences are seeks
+SEEK_TOLERANCE = 1000
+
+
+class State:
+    ''' versioned snapshot of player state, long-polls wait for new versions
+
+        position is only published with other changes and seeks, while
+        playing it is extrapolated from the time it was sampled
+    '''
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+        self.data = {'version': 0, 'running': False}
+        self.sampled_at = time.monotonic()
+
+    def publish(self, data):
+        with self.condition:
+            self.version += 1
+            self.data = dict(data, version=self.version)
+            self.sampled_at = time.monotonic()
+            self.condition.notify_all()
+
+    def position(self):
+        ''' returns playback position in ms as of now, None if unknown
+        '''
+        with self.condition:
+            return self.current()['position']
+
+    def current(self):
+        # caller holds self.condition
+        data = self.data
+        if data.get('playing') and data.get('position') is not None:
+            elapsed = (time.monotonic() - self.sampled_at) * 1000
+            data = dict(data, position=int(data['position'] + elapsed))
+        return data
+
+    def get(self, since=None, timeout=0):
+        ''' returns state, newer than version since if one arrives
+            within timeout seconds
+        '''
+        with self.condition:
+            if since is not None:
+                self.condition.wait_for(lambda: self.version > since, timeout)
+            return self.current()
+
+
+class Daemon:
+    ''' runs Player without a window and publishes its state
+    '''
+
+    def __init__(self, player, interval, max_interval=POLL_MAX):
+        self.player = player
+        self.state = State()
+        # player is shared by main loop and request threads
+        self.lock = threading.RLock()
+        self.scheduler = Scheduler(interval, max_interval, events=player.events)
+        # state without position, to tell if anything changed
+        self.published = None
+
+    def snapshot(self):
+        player, track = self.player, self.player.track
+
+        position, playing = None, False
+        if player.running and track.synced is not None:
+            position, playing = player.position()
+
+        return {
+            'running': player.running,
+            'player': player.player_name,
+            'autoswitch': player.autoswitch,
+            'trackid': track.trackid,
+            'artist': track.artist,
+            'title': track.title,
+            'album': track.album,
+            'source': track.source,
+            'fetching': player.fetching,
+            # with LRC time stamps, clients parse them
+            'lyrics': track.raw,
+            'position': position,
+            'playing': playing,
+        }
+
+    def publish(self, force=False):
+        ''' publishes player state if it changed,
+            returns True if it was published
+        '''
+        data = self.snapshot()
+        compared = dict(data, position=None)
+        if not force and compared == self.published and not self.seeked(data):
+            return False
+
+        self.published = compared
+        self.state.publish(data)
+        return True
+
+    def seeked(self, data):
+        ''' returns True if position of data is not where the published
+            one has got to by now
+        '''
+        if data['position'] is None:
+            return False
+        expected = self.state.position()
+        return expected is None or abs(data['position'] - expected) > SEEK_TOLERANCE
+
+    def refresh(self, cycle_source=False, source=None, cache=True):
+        with self.lock:
+            # cached lyrics may have been edited by a client
+            key = self.player.track.key
+            lyrics_cache.memory.invalidate(lambda k: k == key)
+
+            self.player.refresh(cycle_source, source, cache)
+            self.publish()
+
+    def set_autoswitch(self, autoswitch):
+        with self.lock:
+            self.player.autoswitch = bool(autoswitch)
+            self.publish()
+
+    def loop(self):
+        self.player.add_callback(self.scheduler.wake)
+        with self.lock:
+            self.publish(force=True)
+
+        while True:
+            self.scheduler.wait(timeout=self.scheduler.timeout())
+
+            with self.lock:
+                self.player.update()
+                self.player.fetch()
+                changed = self.publish()
+
+            if changed:
+                self.scheduler.reset()
+            else:
+                self.scheduler.backoff(playing=self.player.running)
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = f'lyrics-in-terminal/{__version__}'
+
+    def log_message(self, format, *args):
+        # headless, requests are not logged
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length == 0:
+            return {}
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def authorized(self):
+        ''' True if the server needs no token or the request has it
+        '''
+        token = getattr(self.server, 'token', None)
+        if token is None:
+            return True
+
+        given = self.headers.get('Authorization', '')
+        if hmac.compare_digest(given.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+            return True
+        self.send_json({'error': 'unauthorized'}, 401)
+        return False
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        daemon = self.server.lyrics_daemon
+
+        try:
+            if url.path == '/current':
+                since = params.get('since')
+                timeout = min(float(params.get('timeout', [LONG_POLL])[0]), LONG_POLL_MAX)
+                self.send_json(daemon.state.get(int(since[0]) if since else None, timeout))
+
+            elif url.path == '/events':
+                self.stream_events(daemon.state)
+
+            elif url.path == '/lyrics':
+                track = params.get('track', [''])[0].strip()
+                if ' - ' not in track:
+                    self.send_json({'error': 'track must be "artist - title"'}, 400)
+                    return
+                lyrics, source = util.get_lyrics(track)
+                self.send_json({'track': track, 'lyrics': lyrics, 'source': source})
+
+            elif url.path == '/providers':
+                from lyrics.providers import get_registry
+                self.send_json(get_registry().get_stats())
+
+            else:
+                self.send_json({'error': 'not found'}, 404)
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+
+        url = urlsplit(self.path)
+        daemon = self.server.lyrics_daemon
+
+        try:
+            body = self.read_json()
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+
+        if url.path == '/refresh':
+            daemon.refresh(bool(body.get('cycle_source')), body.get('source'),
+                           bool(body.get('cache', True)))
+            self.send_json(daemon.state.get())
+
+        elif url.path == '/autoswitch':
+            daemon.set_autoswitch(body.get('autoswitch'))
+            self.send_json(daemon.state.get())
+
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def stream_events(self, state):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        version = None
+        try:
+            while True:
+                data = state.get(version, KEEPALIVE)
+                if data['version'] == version:
+                    self.wfile.write(b': keep-alive\n\n')
+                else:
+                    version = data['version']
+                    self.wfile.write(b'data: ' + json.dumps(data).encode('utf-8') + b'\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        path = self.server_address
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                # left behind by a daemon that did not exit cleanly
+                os.unlink(path)
+            else:
+                raise OSError(f'lyrics daemon already listening on {path}')
+            finally:
+                probe.close()
+
+        # only this user may talk to the daemon, the socket is created
+        # with these permissions instead of being restricted after bind
+        umask = os.umask(0o177)
+        try:
+            socketserver.TCPServer.server_bind(self)
+        finally:
+            os.umask(umask)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    def get_request(self):
+        request, _ = self.socket.accept()
+        return request, ('local', 0)
+
+
+def token_path(path):
+    ''' returns path of token file of TCP listener of daemon on socket path
+    '''
+    return os.path.splitext(path)[0] + '.token'
+
+
+def write_token(path):
+    ''' writes a new random token readable only by this user to path,
+        returns it
+    '''
+    token = secrets.token_urlsafe(32)
+    if os.path.exists(path):
+        os.unlink(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as file:
+        file.write(token + '\n')
+    return token
+
+
+def serve(server, daemon):
+    server.lyrics_daemon = daemon
+    thread = threading.Thread(target=server.serve_forever, name='lyrics-http',
+                              daemon=True)
+    thread.start()
+
+
+def main(argv, defaults):
+    from lyrics.player import Player
+
+    parser = argparse.ArgumentParser(prog='lyrics daemon',
+                                     description='Follow the player and serve its lyrics to pagers and scripts.')
+    parser.add_argument('--socket', metavar='PATH', default=socket_path(),
+                        help=f'unix socket to listen on (default {socket_path()})')
+    parser.add_argument('--port', type=int, default=0,
+                        help='also listen on 127.0.0.1:PORT')
+    parser.add_argument('--player', help='player to follow, disables autoswitch')
+    args = parser.parse_args(argv)
+
+    player = Player.from_config(defaults, args.player)
+    daemon = Daemon(player, defaults['interval'], defaults.getint('max_interval', POLL_MAX))
+
+    os.makedirs(os.path.dirname(args.socket), exist_ok=True)
+    servers = [UnixHTTPServer(args.socket, Handler)]
+    if args.port:
+        tcp = ThreadingHTTPServer(('127.0.0.1', args.port), Handler)
+        # other local users can reach the port, unlike the socket
+        tcp.token = write_token(token_path(args.socket))
+        servers.append(tcp)
+
+    for server in servers:
+        serve(server, daemon)
+    print(f'lyrics daemon listening on {args.socket}'
+          + (f' and 127.0.0.1:{args.port} (token in {token_path(args.socket)})'
+             if args.port else ''), file=sys.stderr)
+
+    try:
+        daemon.loop()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        os.unlink(args.socket)
+        if args.port:
+            os.unlink(token_path(args.socket))
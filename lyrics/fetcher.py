@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+
+import threading
+
+
+class Fetcher:
+    ''' runs lyrics lookups on a background thread pool so that
+        network round trips never block the curses loop
+
+        only the latest submitted fetch is kept, submitting a new one
+        cancels (or discards the result of) the previous fetch
+    '''
+
+    def __init__(self, workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='lyrics-fetch')
+        self.future = None
+        self.key = None
+        # set to stop downloads of the running fetch
+        self.cancel_event = None
+        self.callbacks = []
+
+        # look-ahead fetches run one at a time, never delaying current track
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=1,
+                                                    thread_name_prefix='lyrics-prefetch')
+        self.prefetches = {}
+
+    def add_callback(self, callback):
+        ''' callback() is called from worker thread when a fetch finishes
+        '''
+        self.callbacks.append(callback)
+
+    def notify(self, future=None):
+        for callback in self.callbacks:
+            callback()
+
+    @property
+    def pending(self):
+        ''' True if a fetch has been submitted and its result not collected yet
+        '''
+        return self.future is not None
+
+    def submit(self, key, func, *args, **kwargs):
+        ''' schedules func(*args, **kwargs, cancel=event) in background
+            key -> identifies what is being fetched (e.g. trackid)
+
+            func should stop its downloads once event is set
+        '''
+        self.cancel()
+        self.key = key
+        self.cancel_event = threading.Event()
+        self.future = self.executor.submit(func, *args, cancel=self.cancel_event, **kwargs)
+        self.future.add_done_callback(self.notify)
+
+    def cancel(self):
+        ''' cancels pending fetch, a fetch that is already running is told
+            to stop its downloads and its result is dropped
+        '''
+        if self.future is not None:
+            self.future.cancel()
+            self.cancel_event.set()
+        self.future = None
+        self.key = None
+        self.cancel_event = None
+
+    def result(self):
+        ''' returns (key, result) of finished fetch, or None if there is no
+            finished fetch to collect
+        '''
+        future = self.future
+        if future is None or not future.done():
+            return None
+
+        key = self.key
+        self.future = None
+        self.key = None
+        self.cancel_event = None
+
+        try:
+            return key, future.result()
+        except Exception as e:
+            return key, (['Error: ' + str(e)], None)
+
+    def prefetch(self, jobs):
+        ''' schedules background fetches whose results are only cached
+            jobs -> dict of key: (func, args, kwargs)
+
+            queued prefetches of keys not in jobs are cancelled
+        '''
+        for key in list(self.prefetches):
+            if key not in jobs:
+                self.prefetches.pop(key).cancel()
+
+        for key, (func, args, kwargs) in jobs.items():
+            if key not in self.prefetches:
+                self.prefetches[key] = self.prefetch_executor.submit(func, *args, **kwargs)
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.prefetch_executor.shutdown(wait=False, cancel_futures=True)
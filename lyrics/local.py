@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+''' lyrics of local audio files
+
+    lyrics are read from a sidecar .lrc file next to the audio file,
+    from lyrics embedded in its tags (ID3 USLT, vorbis LYRICS, mp4 ©lyr)
+    or from a sidecar .txt file, in that order
+
+    tracks played without a file path are found through an index of
+    music_dir, mapping track keys to audio files
+'''
+from lyrics import CACHE_PATH
+from lyrics import util
+
+import json
+import os
+import threading
+import time
+
+TAGS_ENABLED = False
+
+try:
+    # making mutagen an optional dependency, file names are used without it
+    import mutagen
+    TAGS_ENABLED = True
+except ImportError:
+    pass
+
+AUDIO_EXTENSIONS = {'.mp3', '.flac', '.ogg', '.opus', '.m4a', '.mp4',
+                    '.aac', '.wav', '.wma', '.ape', '.wv'}
+# synced lyrics are preferred over embedded ones, .txt comes last
+SIDECAR_EXTENSIONS = ('.lrc', '.txt')
+# tag names holding unsynced lyrics, besides ID3 USLT frames
+LYRICS_TAGS = ('lyrics', 'unsyncedlyrics', '\xa9lyr')
+
+# dot prefix keeps the file out of the file cache
+INDEX_PATH = os.path.join(CACHE_PATH, '.local-index.json')
+# seconds between rescans of music_dir
+INDEX_INTERVAL = 600
+# directory of indexed tracks, see configure()
+MUSIC_DIR = ''
+
+
+def track_from_name(name):
+    ''' returns "artist - title" from file name (without extension)
+        or text line, None if it does not look like one
+    '''
+    if ' - ' not in name:
+        return None
+
+    artist, title = name.split(' - ', 1)
+    # drop leading track numbers, "01 - Artist - Title"
+    if artist.strip().isdigit() and ' - ' in title:
+        artist, title = title.split(' - ', 1)
+
+    artist, title = artist.strip(), title.strip()
+    if not artist or not title:
+        return None
+    return f'{artist} - {title}'
+
+
+def track_from_file(path):
+    ''' returns "artist - title" from audio tags, falls back to file name
+    '''
+    if TAGS_ENABLED:
+        try:
+            tags = mutagen.File(path, easy=True)
+            if tags is not None and tags.get('artist') and tags.get('title'):
+                return f"{tags['artist'][0]} - {tags['title'][0]}"
+        except Exception:
+            pass
+
+    return track_from_name(os.path.splitext(os.path.basename(path))[0])
+
+
+def read_text(path):
+    try:
+        with open(path, encoding='utf-8', errors='replace') as file:
+            return file.read()
+    except OSError:
+        return None
+
+
+def read_embedded(path):
+    ''' returns lyrics text embedded in tags of audio file, None if none
+    '''
+    if not TAGS_ENABLED:
+        return None
+
+    try:
+        audio = mutagen.File(path)
+    except Exception:
+        return None
+    if audio is None or audio.tags is None:
+        return None
+
+    tags = audio.tags
+    if hasattr(tags, 'getall'):
+        # ID3
+        for frame in tags.getall('USLT'):
+            if frame.text.strip():
+                return frame.text
+        return None
+
+    for name in LYRICS_TAGS:
+        try:
+            value = tags.get(name)
+        except (KeyError, ValueError):
+            continue
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if value is not None and str(value).strip():
+            return str(value)
+    return None
+
+
+def read_lyrics(path):
+    ''' returns lyrics text of audio file at path, None if it has none
+    '''
+    base = os.path.splitext(path)[0]
+
+    text = read_text(base + SIDECAR_EXTENSIONS[0])
+    if not text or not text.strip():
+        text = read_embedded(path)
+    if not text or not text.strip():
+        text = read_text(base + SIDECAR_EXTENSIONS[1])
+
+    if not text or not text.strip():
+        return None
+    return text
+
+
+class LocalIndex:
+    ''' track key -> audio file of every track under music_dir
+
+        a rescan stats every file and reads tags only of files whose
+        mtime changed, so it stays cheap after the first one
+    '''
+
+    def __init__(self, music_dir, index_path=INDEX_PATH):
+        self.music_dir = music_dir
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        # path -> [mtime, track key]
+        self.files = {}
+        self.keys = {}
+        self.scanned_at = 0
+        self.thread = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        # keys of another version are rebuilt by the next scan
+        if (data.get('music_dir') != self.music_dir
+                or data.get('key_version') != util.KEY_VERSION):
+            return
+        self.files = data.get('files', {})
+        self.keys = {key: path for path, (_, key) in self.files.items() if key}
+        self.scanned_at = data.get('scanned_at', 0)
+
+    def save(self):
+        from lyrics.cache import atomic_write
+
+        with self.lock:
+            data = json.dumps({'music_dir': self.music_dir,
+                               'key_version': util.KEY_VERSION,
+                               'scanned_at': self.scanned_at,
+                               'files': self.files})
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            atomic_write(self.index_path, data)
+        except OSError:
+            pass
+
+    def scan(self):
+        ''' updates index with files added, changed or removed since last scan
+        '''
+        with self.lock:
+            old = self.files
+
+        files = {}
+        for root, _, names in os.walk(self.music_dir):
+            for name in names:
+                if os.path.splitext(name)[1].lower() not in AUDIO_EXTENSIONS:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    continue
+
+                entry = old.get(path)
+                if entry is None or entry[0] != mtime:
+                    track = track_from_file(path)
+                    entry = [mtime, util.get_key(track) if track else None]
+                files[path] = entry
+
+        with self.lock:
+            self.files = files
+            self.keys = {key: path for path, (_, key) in files.items() if key}
+            self.scanned_at = time.time()
+        self.save()
+
+    def refresh(self):
+        ''' rescans music_dir in background if the index is out of date
+        '''
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            if time.time() - self.scanned_at < INDEX_INTERVAL:
+                return
+            self.thread = threading.Thread(target=self.scan, name='lyrics-index',
+                                           daemon=True)
+            self.thread.start()
+
+    def lookup(self, track_name):
+        ''' returns audio file of track, None if it is not in music_dir
+        '''
+        self.refresh()
+        with self.lock:
+            path = self.keys.get(util.get_key(track_name))
+        if path is not None and os.path.exists(path):
+            return path
+        return None
+
+
+indexes = {}
+indexes_lock = threading.Lock()
+
+
+def configure(music_dir=None):
+    ''' sets music_dir of tracks played without a file path
+    '''
+    global MUSIC_DIR
+
+    if music_dir is not None:
+        MUSIC_DIR = music_dir
+
+
+def get_index(music_dir):
+    ''' returns shared index of music_dir, None if it is not a directory
+    '''
+    music_dir = os.path.expanduser(music_dir) if music_dir else ''
+    if not os.path.isdir(music_dir):
+        return None
+
+    with indexes_lock:
+        index = indexes.get(music_dir)
+        if index is None:
+            index = indexes[music_dir] = LocalIndex(music_dir)
+    return index
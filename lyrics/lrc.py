@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+''' time-stamped (LRC) lyrics
+
+    [mm:ss.xx]line of lyrics
+    [mm:ss.xx][mm:ss.xx]repeated line
+    [offset:+/-ms]
+'''
+from array import array
+from bisect import bisect_right
+
+import re
+
+TIME_REGEX = re.compile(r'\[(\d+):(\d{1,2})(?:[.:](\d{1,3}))?\]')
+OFFSET_REGEX = re.compile(r'\[offset:\s*([+-]?\d+)\s*\]', re.IGNORECASE)
+# enhanced LRC word timestamps, <mm:ss.xx>
+WORD_TIME_REGEX = re.compile(r'<\d+:\d{1,2}(?:[.:]\d{1,3})?>')
+
+# lines looked at to tell LRC from plain lyrics
+DETECT_LINES = 10
+
+
+class SyncedLyrics:
+    ''' lyrics lines sorted by start time
+
+        times -> array of start times in ms, times[i] belongs to lines[i]
+    '''
+    __slots__ = ('times', 'lines')
+
+    def __init__(self, times, lines):
+        self.times = times
+        self.lines = lines
+
+    def __len__(self):
+        return len(self.lines)
+
+    def index(self, position):
+        ''' returns index of line sung at position (ms),
+            -1 before the first line
+        '''
+        return bisect_right(self.times, position) - 1
+
+    def next_change(self, position):
+        ''' returns ms from position until next line starts,
+            None after the last line
+        '''
+        i = bisect_right(self.times, position)
+        if i >= len(self.times):
+            return None
+        return self.times[i] - position
+
+
+def to_ms(minutes, seconds, fraction):
+    ms = (int(minutes) * 60 + int(seconds)) * 1000
+    if fraction:
+        # .5 -> 500, .05 -> 50, .005 -> 5
+        ms += int(fraction.ljust(3, '0'))
+    return ms
+
+
+def is_lrc(lines):
+    ''' returns True if lines look like LRC lyrics
+    '''
+    checked = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if TIME_REGEX.match(line):
+            return True
+        checked += 1
+        if checked >= DETECT_LINES:
+            break
+    return False
+
+
+def parse(lines):
+    ''' returns SyncedLyrics of LRC lines, None if there are no timed lines
+    '''
+    entries = []
+    offset = 0
+
+    for line in lines:
+        line = line.strip()
+
+        stamps = []
+        pos = 0
+        match = TIME_REGEX.match(line)
+        while match is not None:
+            stamps.append(to_ms(*match.groups()))
+            pos = match.end()
+            match = TIME_REGEX.match(line, pos)
+
+        if not stamps:
+            # metadata tags, only offset affects timing
+            match = OFFSET_REGEX.match(line)
+            if match is not None:
+                offset = int(match.group(1))
+            continue
+
+        text = WORD_TIME_REGEX.sub('', line[pos:]).strip()
+        for stamp in stamps:
+            entries.append((stamp, text))
+
+    if not entries:
+        return None
+
+    # stable, lines with equal times keep file order
+    entries.sort(key=lambda entry: entry[0])
+
+    # positive offset shows lyrics earlier
+    times = array('q', (max(0, stamp - offset) for stamp, _ in entries))
+    return SyncedLyrics(times, [text for _, text in entries])
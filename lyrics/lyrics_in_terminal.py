@@ -2,17 +2,18 @@
 # -*- coding: utf-8 -*-
 
 
-from lyrics.config import Config
-from lyrics.player import Player
-from lyrics.window import Window
-import traceback
+# only what every mode needs is imported here, curses, dbus, mpd and
+# requests are loaded by the modes that use them
+from lyrics.config import Config, alignment
 
+import os
 import sys
-import curses
 
 
 def ErrorHandler(func):
     def wrapper(*args, **kwargs):
+        import curses
+
         try:
             curses.wrapper(func)
         except KeyboardInterrupt:
@@ -20,39 +21,76 @@ def ErrorHandler(func):
         except curses.error as err:
             print('Please increase terminal window size!')
         except Exception as err:
+            import traceback
+
             print('Unexpected exception occurred.', sys.exc_info(), err)
             traceback.print_exc()
 
     return wrapper
 
 
+def configure_cache(defaults):
+    from lyrics import cache
+    from lyrics import local
+    local.configure(defaults.get('music_dir', ''))
+    cache.configure(defaults.get('cache_backend'),
+                    defaults.getint('miss_ttl', None),
+                    defaults.get('cache_compression', 'off'),
+                    defaults.getint('cache_max_entries', 0),
+                    int(defaults.getfloat('cache_max_mb', 0) * 1024 * 1024),
+                    defaults.get('cache_eviction', 'lru'))
+
+
+def print_timings():
+    ''' prints requests, provider stats and in-memory cache stats
+        of this run to stderr
+    '''
+    from lyrics.util import get_timings
+
+    for t in get_timings():
+        print(f'{t.host:24} {t.status or "-":>4} '
+              f'{t.response or 0:7.3f}s {t.total:7.3f}s', file=sys.stderr)
+
+    from lyrics import providers
+
+    if providers.registry is not None:
+        for name, s in providers.registry.get_stats().items():
+            print(f'{name:24} {s["success"]:4.0%} '
+                  f'{s["latency"] or 0:7.3f}s {s["parse_failures"]:4} parse failures'
+                  + (' (broken)' if s['broken'] else ''), file=sys.stderr)
+        for name, error in providers.registry.failed.items():
+            print(f'{name:24} plugin failed to load: {error}', file=sys.stderr)
+
+    # in-memory caches, of modules this run has imported
+    for module, attr in (('cache', 'memory'), ('track', 'rendered')):
+        loaded = sys.modules.get('lyrics.' + module)
+        if loaded is None:
+            continue
+        s = getattr(loaded, attr).stats()
+        print(f'{module + "." + attr:24} {s["hits"]:4} hits {s["misses"]:4} misses '
+              f'{s["evictions"]:4} evictions {s["size"]}/{s["maxsize"]} entries',
+              file=sys.stderr)
+
+
 @ErrorHandler
 def init_pager(stdscr=None):
-    defaults = Config('OPTIONS')
+    from lyrics.player import Player
+    from lyrics.window import Window
 
-    if len(sys.argv) >= 2:
-        player_name = sys.argv[1].strip()
-        autoswitch = False
-
-    else:
-        player_name = defaults['player'].strip()
-        autoswitch = defaults.getboolean('autoswitch')
+    defaults = Config('OPTIONS')
+    configure_cache(defaults)
 
-    align = defaults['alignment']
+    player_name = sys.argv[1].strip() if len(sys.argv) >= 2 else None
 
-    if align == 'center':
-        align = 0
-    elif align == 'right':
-        align = 2
-    else:
-        align = 1
+    player = None
+    if player_name is None and defaults.get('daemon', 'auto') != 'off':
+        # thin client of a running lyrics daemon
+        from lyrics.client import connect
+        player = connect(alignment(defaults.get('alignment')))
 
+    if player is None:
+        player = Player.from_config(defaults, player_name)
     interval = defaults['interval']
-    source = defaults['source']
-    mpd_connect = [defaults['mpd_host'],
-                   defaults['mpd_port'], defaults['mpd_pass']]
-
-    player = Player(player_name, source, autoswitch, mpd_connect, align=align)
     win = Window(stdscr, player, timeout=interval)
 
     win.main()
@@ -71,6 +109,9 @@ def main():
 
             from lyrics.track import Track
 
+            configure_cache(Config('OPTIONS'))
+
+            # cache hits return without loading requests
             track = Track(artist=artist, title=title)
             track.get_lyrics('any')
 
@@ -78,10 +119,41 @@ def main():
             print('-' * track.width, '\n')
             print(track.get_text())
 
+            if os.environ.get('LYRICS_TIMINGS'):
+                print_timings()
+
+            exit(0)
+
+        elif sys.argv[1] == 'daemon':
+            from lyrics import daemon
+
+            defaults = Config('OPTIONS')
+            configure_cache(defaults)
+            daemon.main(sys.argv[2:], defaults)
+
+            exit(0)
+
+        elif sys.argv[1] == 'cache':
+            from lyrics import cache_admin
+
+            defaults = Config('OPTIONS')
+            configure_cache(defaults)
+            exit(cache_admin.main(sys.argv[2:], defaults))
+
+        elif sys.argv[1] == 'prefetch':
+            from lyrics import prefetch
+
+            defaults = Config('OPTIONS')
+            configure_cache(defaults)
+            prefetch.main(sys.argv[2:], defaults)
+
             exit(0)
 
     init_pager()
 
+    if os.environ.get('LYRICS_TIMINGS'):
+        print_timings()
+
 
 if __name__ == "__main__":
     main()
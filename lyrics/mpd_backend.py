@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+MPD_ENABLED = False
+
+try:
+    # making mpd an optional dependency
+    from mpd import MPDClient
+    MPD_ENABLED = True
+except ImportError:
+    pass
+
+# seconds between reconnect attempts, doubled after every failure
+BACKOFF_MIN = 1
+BACKOFF_MAX = 60
+
+
+class MpdWatcher:
+    ''' long-lived MPD backend
+
+        keeps one authenticated connection open on a background thread,
+        waits for changes with MPD's `idle` command and caches player
+        status, current song and upcoming queue for Player to read
+    '''
+
+    def __init__(self, host, port, password='', lookahead=0):
+        self.host = host
+        self.port = port
+        self.password = password
+        # number of upcoming queue entries to read
+        self.lookahead = lookahead
+
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        self.callbacks = []
+
+        self.connected = False
+        self.status = {}
+        self.song = {}
+        self.queue = []
+        # monotonic time of last read, elapsed is extrapolated from it
+        self.read_at = 0
+
+        self.thread = threading.Thread(target=self.run, name='lyrics-mpd',
+                                       daemon=True)
+        self.thread.start()
+
+    def add_callback(self, callback):
+        ''' callback() is called from watcher thread on every change
+        '''
+        self.callbacks.append(callback)
+
+    def notify(self):
+        self.changed.set()
+        for callback in self.callbacks:
+            callback()
+
+    def connect(self):
+        client = MPDClient()
+        client.connect(self.host, self.port)
+
+        if self.password != '':
+            client.password(self.password)
+        return client
+
+    def read(self, client):
+        ''' stores current status, song and upcoming songs of mpd
+        '''
+        status = client.status()
+        song = client.currentsong()
+        queue = self.read_queue(client, status)
+
+        with self.lock:
+            self.connected = True
+            self.status = status
+            self.song = song
+            self.queue = queue
+            self.read_at = time.monotonic()
+        self.notify()
+
+    def read_queue(self, client, status):
+        ''' returns songs that play after current one
+        '''
+        if self.lookahead <= 0 or 'nextsong' not in status:
+            return []
+
+        start = int(status['nextsong'])
+        if status.get('random') == '1':
+            # only the next song is known in random mode
+            return client.playlistinfo(start)
+
+        return client.playlistinfo(f'{start}:{start + self.lookahead}')
+
+    def run(self):
+        backoff = BACKOFF_MIN
+
+        while True:
+            client = None
+            try:
+                client = self.connect()
+                backoff = BACKOFF_MIN
+
+                while True:
+                    self.read(client)
+                    # blocks until playback or queue changes
+                    client.idle('player', 'playlist', 'options')
+            except Exception:
+                with self.lock:
+                    was_connected = self.connected
+                    self.connected = False
+                    self.status = {}
+                    self.song = {}
+                    self.queue = []
+                if was_connected:
+                    self.notify()
+
+            if client is not None:
+                try:
+                    client.disconnect()
+                except Exception:
+                    pass
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, BACKOFF_MAX)
+
+    def poll(self):
+        ''' returns True if mpd changed since last poll
+        '''
+        if self.changed.is_set():
+            self.changed.clear()
+            return True
+        return False
+
+    def current(self):
+        ''' returns (state, currentsong) from last change,
+            state is None if mpd is not connected
+        '''
+        with self.lock:
+            return self.status.get('state'), dict(self.song)
+
+    def elapsed(self):
+        ''' returns (state, elapsed seconds, monotonic time it was read at),
+            elapsed is None if nothing is playing
+        '''
+        with self.lock:
+            elapsed = self.status.get('elapsed')
+            return (self.status.get('state'),
+                    None if elapsed is None else float(elapsed), self.read_at)
+
+    def upcoming(self):
+        ''' returns list of upcoming songs from last change
+        '''
+        with self.lock:
+            return list(self.queue)
+
+
+def get_watcher(host, port, password='', lookahead=0):
+    ''' returns MpdWatcher, or None if python-mpd2 is not installed
+    '''
+    if not MPD_ENABLED:
+        return None
+    return MpdWatcher(host, port, password, lookahead)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from urllib.parse import unquote, urlsplit
+
+import dbus
+import re
+import threading
+import time
+
+EVENTS_ENABLED = False
+
+try:
+    # signals need a main loop, making PyGObject an optional dependency
+    from gi.repository import GLib
+    from dbus.mainloop.glib import DBusGMainLoop, threads_init
+    EVENTS_ENABLED = True
+except ImportError:
+    pass
+
+MPRIS_PREFIX = 'org.mpris.MediaPlayer2.'
+MPRIS_PATH = '/org/mpris/MediaPlayer2'
+PLAYER_INTERFACE = 'org.mpris.MediaPlayer2.Player'
+PROPERTIES_INTERFACE = 'org.freedesktop.DBus.Properties'
+TRACKLIST_INTERFACE = 'org.mpris.MediaPlayer2.TrackList'
+
+PLAYER_REGEX = re.compile(r'org.mpris.MediaPlayer2|plasma-browser-integration', re.IGNORECASE)
+
+# service -> bus name, owner -> unique connection name,
+# status -> PlaybackStatus, None until the player answers,
+# since -> time when status last changed
+PlayerInfo = namedtuple('PlayerInfo', ['service', 'owner', 'status', 'since'])
+
+
+def player_name(service):
+    ''' returns short player name of mpris service name
+    '''
+    return service.split('MediaPlayer2.')[-1]
+
+
+def url_path(url):
+    ''' returns local path of xesam:url, None if it is not a file:// url
+    '''
+    if not url:
+        return None
+
+    parts = urlsplit(str(url))
+    if parts.scheme != 'file':
+        return None
+    return unquote(parts.path)
+
+
+def upcoming_tracks(interface, trackid, count):
+    ''' returns metadata of up to count tracks after trackid from
+        MPRIS TrackList, [] if player does not expose one
+
+        interface -> properties interface of player object
+    '''
+    try:
+        if not interface.Get('org.mpris.MediaPlayer2', 'HasTrackList'):
+            return []
+
+        tracks = list(interface.Get(TRACKLIST_INTERFACE, 'Tracks'))
+        if trackid not in tracks:
+            return []
+
+        position = tracks.index(trackid)
+        upcoming = tracks[position + 1:position + 1 + count]
+        if not upcoming:
+            return []
+
+        tracklist = dbus.Interface(interface.proxy_object, TRACKLIST_INTERFACE)
+        return list(tracklist.GetTracksMetadata(upcoming))
+    except dbus.exceptions.DBusException:
+        return []
+
+
+class PlayerRegistry:
+    ''' MPRIS players on the session bus with their PlaybackStatus
+
+        kept up to date by MprisWatcher signals, without a watcher
+        scan() has to be called to refresh it
+    '''
+
+    def __init__(self, bus=None):
+        self.bus = bus
+        self.lock = threading.RLock()
+        # service -> PlayerInfo
+        self.players = {}
+
+    def get_bus(self):
+        if self.bus is None:
+            self.bus = dbus.SessionBus()
+        return self.bus
+
+    def get_interface(self, service):
+        obj = self.get_bus().get_object(service, MPRIS_PATH)
+        return dbus.Interface(obj, PROPERTIES_INTERFACE)
+
+    def scan(self):
+        ''' rebuilds registry from all names on the bus
+        '''
+        bus = self.get_bus()
+        services = [str(service) for service in bus.list_names()
+                    if PLAYER_REGEX.search(service)]
+
+        with self.lock:
+            self.players.clear()
+        for service in services:
+            self.add(service)
+
+    def add(self, service, owner=None):
+        ''' registers player and queries its PlaybackStatus
+        '''
+        try:
+            if owner is None:
+                owner = self.get_bus().get_name_owner(service)
+        except dbus.exceptions.DBusException:
+            # name is gone already
+            return
+
+        with self.lock:
+            self.players[service] = PlayerInfo(service, str(owner), self.query(service),
+                                               time.monotonic())
+
+    def query(self, service):
+        ''' returns PlaybackStatus of player, None if it can not tell yet
+        '''
+        try:
+            return str(self.get_interface(service).Get(PLAYER_INTERFACE, 'PlaybackStatus'))
+        except dbus.exceptions.DBusException:
+            # players may claim their bus name before exporting MPRIS_PATH,
+            # PropertiesChanged or the next query fill in the status
+            return None
+
+    def query_unknown(self):
+        ''' queries PlaybackStatus of players registered without one
+        '''
+        with self.lock:
+            unknown = [s for s, info in self.players.items() if info.status is None]
+
+        for service in unknown:
+            status = self.query(service)
+            if status is None:
+                continue
+            with self.lock:
+                info = self.players.get(service)
+                if info is not None and info.status is None:
+                    self.players[service] = info._replace(status=status,
+                                                          since=time.monotonic())
+
+    def remove(self, service):
+        with self.lock:
+            self.players.pop(service, None)
+
+    def set_status(self, owner, status):
+        ''' updates PlaybackStatus of player by its unique bus name
+        '''
+        with self.lock:
+            for service, info in self.players.items():
+                if info.owner == owner and info.status != status:
+                    self.players[service] = info._replace(status=str(status),
+                                                          since=time.monotonic())
+
+    def status(self, name):
+        ''' returns PlaybackStatus of player by short name, None if unknown
+        '''
+        with self.lock:
+            for service, info in self.players.items():
+                if player_name(service) == name:
+                    return info.status
+        return None
+
+    def playing(self, priority=()):
+        ''' returns services of playing players, best first
+
+            players named in priority come first, in that order,
+            then the one that started playing most recently
+            and finally by name, so the choice is deterministic
+        '''
+        priority = list(priority)
+        self.query_unknown()
+
+        def rank(info):
+            name = player_name(info.service)
+            preferred = priority.index(name) if name in priority else len(priority)
+            return preferred, -info.since, info.service
+
+        with self.lock:
+            playing = [info for info in self.players.values() if info.status == 'Playing']
+
+        return [info.service for info in sorted(playing, key=rank)]
+
+
+class MprisWatcher:
+    ''' event-driven MPRIS backend
+
+        subscribes to PropertiesChanged and Seeked of media players and
+        NameOwnerChanged of the bus on a GLib main loop thread,
+        Player.update only has to query D-Bus after one of them fired
+    '''
+
+    def __init__(self):
+        threads_init()
+        DBusGMainLoop(set_as_default=True)
+
+        self.bus = dbus.SessionBus()
+        self.registry = PlayerRegistry(self.bus)
+        self.changed = threading.Event()
+        # first update always polls
+        self.changed.set()
+        self.callbacks = []
+
+        self.bus.add_signal_receiver(self.properties_changed,
+                                     signal_name='PropertiesChanged',
+                                     dbus_interface=PROPERTIES_INTERFACE,
+                                     path=MPRIS_PATH,
+                                     sender_keyword='sender')
+        # Position is not announced by PropertiesChanged, jumps are
+        self.bus.add_signal_receiver(self.seeked,
+                                     signal_name='Seeked',
+                                     dbus_interface=PLAYER_INTERFACE,
+                                     path=MPRIS_PATH,
+                                     sender_keyword='sender')
+        self.bus.add_signal_receiver(self.name_owner_changed,
+                                     signal_name='NameOwnerChanged',
+                                     dbus_interface='org.freedesktop.DBus',
+                                     bus_name='org.freedesktop.DBus')
+
+        self.registry.scan()
+
+        self.loop = GLib.MainLoop()
+        self.thread = threading.Thread(target=self.loop.run,
+                                       name='lyrics-mpris', daemon=True)
+        self.thread.start()
+
+    def add_callback(self, callback):
+        ''' callback() is called from watcher thread on every change
+        '''
+        self.callbacks.append(callback)
+
+    def notify(self):
+        self.changed.set()
+        for callback in self.callbacks:
+            callback()
+
+    def properties_changed(self, interface, changed, invalidated, sender=None):
+        if interface != PLAYER_INTERFACE:
+            return
+
+        if 'PlaybackStatus' in changed:
+            self.registry.set_status(sender, changed['PlaybackStatus'])
+
+        if 'Metadata' in changed or 'PlaybackStatus' in changed or invalidated:
+            self.notify()
+
+    def seeked(self, position, sender=None):
+        # Player.update drops the extrapolated position
+        self.notify()
+
+    def name_owner_changed(self, name, old_owner, new_owner):
+        # player started or quit
+        if name.startswith(MPRIS_PREFIX):
+            if new_owner:
+                self.registry.add(str(name), new_owner)
+            else:
+                self.registry.remove(str(name))
+            self.notify()
+
+    def poll(self):
+        ''' returns True if players changed since last poll
+        '''
+        if self.changed.is_set():
+            self.changed.clear()
+            return True
+        return False
+
+    def stop(self):
+        self.loop.quit()
+
+
+def get_watcher():
+    ''' returns MprisWatcher, or None if signals are not available
+        (polling fallback)
+    '''
+    if not EVENTS_ENABLED:
+        return None
+
+    try:
+        return MprisWatcher()
+    except dbus.exceptions.DBusException:
+        return None
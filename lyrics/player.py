@@ -1,26 +1,35 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+from lyrics.config import alignment
+from lyrics.fetcher import Fetcher
 from lyrics.track import Track
+from lyrics import util
+from lyrics import mpris_backend
+
+from lyrics import mpd_backend
+from lyrics.mpd_backend import MPD_ENABLED
 
 import dbus
+import os
 import re
+import time
 
-MPD_ENABLED = False
-
-try:
-    # making mpd an optional dependency
-    from mpd import MPDClient as mpd
-    MPD_ENABLED = True
-except ImportError:
-    pass
+# seconds after which MPRIS playback position is queried again,
+# in between it is extrapolated
+POSITION_RESYNC = 2
 
 
 class Player:
-    def __init__(self, name, source, autoswitch, mpd_connect, **kwargs):
+    def __init__(self, name, source, autoswitch, mpd_connect,
+                 player_priority=None, lookahead=0, music_dir='', **kwargs):
         self.player_name = name
+        self.default_player = name
+        self.player_priority = list(player_priority or [])
         self.default_source = source
 
         self.autoswitch = autoswitch
+        # number of upcoming tracks to prefetch lyrics of
+        self.lookahead = lookahead
 
         self.running = False
         self.track = Track(**kwargs)
@@ -29,78 +38,118 @@ class Player:
         self.mpd_host = mpd_connect[0] or '127.0.0.1'
         self.mpd_port = mpd_connect[1] or 6600
         self.mpd_pass = mpd_connect[2] or ''
+        # mpd music_directory, mpd only reports paths relative to it
+        self.music_dir = os.path.expanduser(music_dir) if music_dir else ''
+        # (position ms, monotonic time, playing) of last MPRIS Position query
+        self.position_sample = None
 
         self.mpd_enabled = MPD_ENABLED
+        self.fetcher = Fetcher()
+        # None if D-Bus signals are unavailable, update() then polls every call
+        self.watcher = mpris_backend.get_watcher()
+        # mpris players with cached PlaybackStatus, used by autoswitch
+        if self.watcher is not None:
+            self.registry = self.watcher.registry
+        else:
+            self.registry = mpris_backend.PlayerRegistry()
+        # persistent mpd connection, None if python-mpd2 is not installed
+        self.mpd = mpd_backend.get_watcher(self.mpd_host, self.mpd_port,
+                                           self.mpd_pass, lookahead)
         self.update()
 
+    @classmethod
+    def from_config(cls, options, name=None):
+        ''' returns Player set up from OPTIONS section of config
+            name -> player to follow, disables autoswitch if given
+        '''
+        if name:
+            autoswitch = False
+        else:
+            name = options['player'].strip()
+            autoswitch = options.getboolean('autoswitch')
+
+        mpd_connect = [options['mpd_host'], options['mpd_port'], options['mpd_pass']]
+
+        return cls(name, options['source'], autoswitch, mpd_connect,
+                   player_priority=options.getlist('player_priority'),
+                   lookahead=options.getint('lookahead', 0),
+                   music_dir=options.get('music_dir', ''),
+                   align=alignment(options.get('alignment')),
+                   sources=options.getlist('priority'))
+
+    @property
+    def events(self):
+        ''' True if backends report every change, update() then only
+            has to be called after a callback
+        '''
+        return self.watcher is not None
+
+    def add_callback(self, callback):
+        ''' callback() is called from background threads when player,
+            track or fetched lyrics change
+        '''
+        for source in (self.watcher, self.mpd, self.fetcher):
+            if source is not None:
+                source.add_callback(callback)
+
     def check_playing(self):
         ''' checks playing status of current player
         '''
 
         if self.player_interface:
-            status = self.player_interface.Get(
-                'org.mpris.MediaPlayer2.Player', 'PlaybackStatus')
+            if self.watcher is not None:
+                # kept up to date by PropertiesChanged signals
+                status = self.registry.status(self.player_name)
+            else:
+                status = self.player_interface.Get(
+                    'org.mpris.MediaPlayer2.Player', 'PlaybackStatus')
             self.running = (status == 'Playing')
 
-    # def get_players(self):
-    #     players = []
-    #     for service in dbus.SessionBus().list_names():
-    #         if re.findall(r'org.mpris.MediaPlayer2|plasma-browser-integration', service, re.IGNORECASE):
-    #         obj = bus.get_object(service, '/org/mpris/MediaPlayer2')
-    #         interface = dbus.Interface(obj, 'org.freedesktop.DBus.Properties')
-    #         status = str(interface.Get(
-    #             'org.mpris.MediaPlayer2.Player', 'PlaybackStatus'))
-    #         players.append((str(service), status))
-    #     return players
-
     def get_active_player(self):
         ''' returns name of playing media source/player
         '''
 
-        session_bus = dbus.SessionBus()
-        for service in session_bus.list_names():
-            if re.findall(r'org.mpris.MediaPlayer2|plasma-browser-integration', service, re.IGNORECASE):
-                obj = session_bus.get_object(
-                    service, '/org/mpris/MediaPlayer2')
-                interface = dbus.Interface(
-                    obj, 'org.freedesktop.DBus.Properties')
-                status = interface.Get(
-                    'org.mpris.MediaPlayer2.Player', 'PlaybackStatus')
+        if self.watcher is None:
+            # no signals to keep registry current
+            self.registry.scan()
 
-                if status == 'Playing':
-                    self.player_name = service.split('MediaPlayer2.')[-1]
-                    self.player_interface = interface
-                    self.running = True
-                    return
+        # configured player wins if several are playing
+        priority = [self.default_player] + self.player_priority
+        for service in self.registry.playing(priority):
+            self.player_name = mpris_backend.player_name(service)
+            self.player_interface = self.registry.get_interface(service)
+            self.running = True
+            return
 
     def mpd_active(self):
         """ Check if mpd is active and get metadata """
-        client = mpd()
-        try:
-            client.connect(self.mpd_host, self.mpd_port)
-        except Exception as e:
-            return False
-
-        if self.mpd_pass != '':
-            client.password(self.mpd_pass)
+        state, currentsong = self.mpd.current()
 
-        if client.status()['state'] == 'play':
+        if state == 'play':
             self.player_name = "mpd"
             self.running = True
-            currentsong = client.currentsong()
 
             if 'album' in currentsong:
                 album = currentsong['album']
             else:
                 album = ''
 
-            title = currentsong['title']
-            artist = currentsong['artist']
-            album = album
-            trackid = currentsong['id']
+            try:
+                title = currentsong['title']
+                artist = currentsong['artist']
+                trackid = currentsong['id']
+            except KeyError:
+                return False
+
+            path = None
+            if self.music_dir and 'file' in currentsong:
+                path = os.path.join(self.music_dir, currentsong['file'])
+
+            # queue may have changed without a track change
+            self.prefetch_upcoming()
 
             if self.track.title != title:
-                self.track.update(artist, title, album, trackid)
+                self.track.update(artist, title, album, trackid, path)
                 self.refresh()
                 return True
         else:
@@ -130,6 +179,14 @@ class Player:
         ''' checks if player or track have changed or not
         '''
 
+        mpd_changed = self.mpd is not None and self.mpd.poll()
+        if self.watcher is not None and not self.watcher.poll() and not mpd_changed:
+            # no signal from either backend since last update
+            return False
+
+        # playback may have been paused or seeked
+        self.position_sample = None
+
         try:
             if self.autoswitch:
                 self.check_playing()
@@ -168,6 +225,7 @@ class Player:
                 # arturl = metadata['mpris:artUrl']
                 trackid = metadata.get('mpris:trackid')
                 trackid = title if trackid is None else trackid
+                path = mpris_backend.url_path(metadata.get('xesam:url'))
             except (IndexError, KeyError) as e:
                 self.running = False
                 return False
@@ -176,18 +234,125 @@ class Player:
                 self.running = False
             elif self.track.trackid != trackid or self.track.title != title:
                 # update track
-                self.track.update(artist, title, album, trackid)
+                self.track.update(artist, title, album, trackid, path)
                 self.refresh()
+                self.prefetch_upcoming()
                 return True
 
-        elif MPD_ENABLED:
+        elif self.mpd is not None:
             return self.mpd_active()
 
         return False
 
     def refresh(self, cycle_source=False, source=None, cache=True):
-        ''' Re-fetches lyrics from procided source
+        ''' Re-fetches lyrics from procided source in background,
+            track shows placeholder text until fetch() collects the result
             source -> source name ('google' or 'azlyrics')
             cache -> bool | wether to store cache file
         '''
-        self.track.get_lyrics(source, cycle_source, cache)
+        source, cache = self.track.select_source(source, cycle_source, cache)
+        self.track.set_fetching()
+        self.fetcher.submit(self.track.trackid, util.get_lyrics,
+                            self.track.track_name, source, cache=cache,
+                            priority=self.track.sources,
+                            album=self.track.album, path=self.track.path,
+                            trackid=self.track.trackid)
+
+    def position(self):
+        ''' returns (playback position of current track in ms, playing),
+            position is None if player does not report one
+        '''
+        now = time.monotonic()
+
+        if self.player_name == 'mpd' and self.mpd is not None:
+            state, elapsed, read_at = self.mpd.elapsed()
+            if elapsed is None:
+                return None, False
+            playing = state == 'play'
+            if playing:
+                elapsed += now - read_at
+            return int(elapsed * 1000), playing
+
+        if self.player_interface is None:
+            return None, False
+
+        sample = self.position_sample
+        if sample is None or now - sample[1] > POSITION_RESYNC:
+            try:
+                position = self.player_interface.Get(
+                    'org.mpris.MediaPlayer2.Player', 'Position')
+                status = self.player_interface.Get(
+                    'org.mpris.MediaPlayer2.Player', 'PlaybackStatus')
+            except dbus.exceptions.DBusException:
+                return None, False
+            # Position is in microseconds
+            sample = self.position_sample = (int(position) // 1000, now,
+                                             status == 'Playing')
+
+        position, sampled_at, playing = sample
+        if playing:
+            position += (now - sampled_at) * 1000
+        return int(position), playing
+
+    def get_upcoming(self):
+        ''' returns list of (artist, title, album) of tracks queued
+            after current track
+        '''
+        upcoming = []
+
+        if self.player_name == 'mpd' and self.mpd is not None:
+            for song in self.mpd.upcoming():
+                artist = song.get('artist', '')
+                artist = artist[0] if isinstance(artist, list) else artist
+                upcoming.append((artist, song.get('title', ''), song.get('album', '')))
+
+        elif self.player_interface is not None:
+            for metadata in mpris_backend.upcoming_tracks(self.player_interface,
+                                                          self.track.trackid,
+                                                          self.lookahead):
+                artist = metadata.get('xesam:artist', '')
+                artist = artist[0] if isinstance(artist, list) and artist else artist
+                upcoming.append((str(artist), str(metadata.get('xesam:title', '')),
+                                 str(metadata.get('xesam:album', ''))))
+
+        return upcoming[:self.lookahead]
+
+    def prefetch_upcoming(self):
+        ''' fetches lyrics of next tracks in player queue into cache,
+            so they are ready when the track changes
+        '''
+        if self.lookahead <= 0:
+            return
+
+        jobs = {}
+        for artist, title, album in self.get_upcoming():
+            if not artist.strip() or not title.strip():
+                continue
+            track_name = f'{artist.strip()} - {title.strip()}'
+            jobs[util.get_key(track_name)] = (util.get_lyrics, (track_name,),
+                                              {'priority': self.track.sources,
+                                               'album': album})
+
+        self.fetcher.prefetch(jobs)
+
+    @property
+    def fetching(self):
+        ''' True if lyrics of current track are still being fetched
+        '''
+        return self.fetcher.pending
+
+    def fetch(self):
+        ''' swaps in lyrics of finished background fetch
+            returns -> bool | whether track lyrics were updated
+        '''
+        result = self.fetcher.result()
+        if result is None:
+            return False
+
+        trackid, (lyrics, source) = result
+        if trackid != self.track.trackid:
+            # track changed while fetching
+            return False
+
+        self.track.set_lyrics(lyrics, source)
+        return True
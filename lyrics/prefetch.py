@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+''' bulk cache pre-warm
+
+    lyrics prefetch [-j JOBS] [--rate SECONDS] [--restart]
+                    (--m3u FILE | --dir DIR | --stdin | --mpd)
+'''
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from lyrics import CACHE_PATH
+from lyrics import cache as lyrics_cache
+from lyrics import util
+from lyrics.local import AUDIO_EXTENSIONS, track_from_name, track_from_file
+
+import argparse
+import os
+import sys
+
+# keys of tracks already processed by an interrupted run
+PROGRESS_PATH = os.path.join(CACHE_PATH, 'prefetch.progress')
+
+
+def read_m3u(filepath):
+    ''' yields tracks of M3U playlist, from #EXTINF titles or tagged files
+    '''
+    base = os.path.dirname(os.path.abspath(filepath))
+    extinf = None
+
+    with open(filepath, encoding='utf-8', errors='replace') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                # #EXTINF:duration,Artist - Title
+                extinf = track_from_name(line.split(',', 1)[-1])
+            elif line and not line.startswith('#'):
+                path = os.path.join(base, line)
+                if extinf is not None:
+                    yield extinf
+                elif os.path.isfile(path):
+                    track = track_from_file(path)
+                    if track is not None:
+                        yield track
+                else:
+                    track = track_from_name(os.path.splitext(os.path.basename(line))[0])
+                    if track is not None:
+                        yield track
+                extinf = None
+
+
+def read_dir(dirpath):
+    ''' yields tracks of all audio files under dirpath
+    '''
+    for root, _, files in os.walk(dirpath):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                track = track_from_file(os.path.join(root, name))
+                if track is not None:
+                    yield track
+
+
+def read_lines(stream):
+    ''' yields tracks of "artist - title" lines
+    '''
+    for line in stream:
+        track = track_from_name(line.strip())
+        if track is not None:
+            yield track
+
+
+def read_mpd(host, port, password=''):
+    ''' yields tracks of whole mpd database
+    '''
+    from mpd import MPDClient
+
+    client = MPDClient()
+    client.connect(host, port)
+    try:
+        if password:
+            client.password(password)
+
+        for song in client.listallinfo():
+            artist, title = song.get('artist'), song.get('title')
+            if isinstance(artist, list):
+                artist = artist[0]
+            if 'file' in song and artist and title:
+                yield f'{artist} - {title}'
+    finally:
+        client.disconnect()
+
+
+def load_progress():
+    try:
+        with open(PROGRESS_PATH) as file:
+            return set(file.read().splitlines())
+    except OSError:
+        return set()
+
+
+def prefetch(tracks, jobs=4, restart=False, out=sys.stderr):
+    ''' fills lyrics cache for tracks with a bounded worker pool,
+        progress is saved so an interrupted run can be resumed
+
+        at most jobs * 2 lookups are queued at a time, lookups that
+        failed with an error in an earlier run are retried
+
+        returns dict of counts: found, cached, missed, errors, skipped
+    '''
+    done = set() if restart else load_progress()
+
+    counts = dict.fromkeys(['found', 'cached', 'missed', 'errors', 'skipped'], 0)
+
+    queue = {}
+    for track in tracks:
+        key = util.get_key(track)
+        if key in done:
+            counts['skipped'] += 1
+        elif key not in queue:
+            queue[key] = track
+
+    total = len(queue)
+    store = lyrics_cache.get_store()
+    waiting = iter(queue.items())
+    # future -> key of lookups submitted to pool
+    futures = {}
+
+    def submit():
+        for key, track in waiting:
+            miss = store.get_miss(key)
+            if miss is not None and miss.error:
+                # would be answered with the cached error until it expires
+                store.clear_miss(key)
+            futures[pool.submit(util.get_lyrics, track)] = key
+            if len(futures) >= jobs * 2:
+                break
+
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    i = 0
+    try:
+        with open(PROGRESS_PATH, 'w' if restart else 'a') as progress:
+            submit()
+            while futures:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i += 1
+                    key = futures.pop(future)
+                    try:
+                        lyrics, source = future.result()
+                    except Exception:
+                        status = 'errors'
+                    else:
+                        if source == 'cache':
+                            status = 'cached'
+                        elif lyrics and lyrics[0] == util.NOT_FOUND:
+                            status = 'missed'
+                        elif lyrics and lyrics[0].startswith('Error:'):
+                            status = 'errors'
+                        else:
+                            status = 'found'
+                    counts[status] += 1
+
+                    # failed lookups are retried when resuming
+                    if status != 'errors':
+                        progress.write(key + '\n')
+                        progress.flush()
+
+                    print(f"\r[{i}/{total}] found {counts['found']}, "
+                          f"cached {counts['cached']}, missed {counts['missed']}, "
+                          f"errors {counts['errors']}", end='', file=out)
+                submit()
+    except BaseException:
+        # interrupted, drop queued lookups
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+
+    pool.shutdown()
+    print(file=out)
+    # run completed, next one starts over
+    os.remove(PROGRESS_PATH)
+
+    return counts
+
+
+def main(argv, defaults):
+    parser = argparse.ArgumentParser(prog='lyrics prefetch',
+                                     description='Fetch lyrics of many tracks into cache.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--m3u', metavar='FILE', help='M3U playlist')
+    source.add_argument('--dir', metavar='DIR', help='directory of audio files')
+    source.add_argument('--stdin', action='store_true',
+                        help='"artist - title" lines from stdin')
+    source.add_argument('--mpd', action='store_true', help='whole MPD database')
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help='concurrent lookups (default 4)')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='minimum seconds between requests to one host (default 1)')
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore progress of an interrupted run')
+    args = parser.parse_args(argv)
+
+    if args.m3u:
+        tracks = read_m3u(args.m3u)
+    elif args.dir:
+        tracks = read_dir(args.dir)
+    elif args.stdin:
+        tracks = read_lines(sys.stdin)
+    else:
+        tracks = read_mpd(defaults['mpd_host'] or '127.0.0.1',
+                          defaults['mpd_port'] or 6600, defaults['mpd_pass'])
+
+    util.set_rate_limit(args.rate)
+
+    if not os.path.isdir(CACHE_PATH):
+        os.makedirs(CACHE_PATH)
+
+    try:
+        counts = prefetch(tracks, max(1, args.jobs), args.restart)
+    except KeyboardInterrupt:
+        print('\nInterrupted, run again to resume.', file=sys.stderr)
+        sys.exit(130)
+
+    print(', '.join(f'{k} {v}' for k, v in counts.items()))
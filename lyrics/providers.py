@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+''' lyrics source providers
+
+    a provider finds the lyrics page of a track (search), downloads it
+    (fetch) and extracts the lyrics (parse). google, azlyrics and genius
+    are built in, so is local, which reads lyrics of the audio file on
+    disk before any network request.
+
+    more providers are registered by installed packages under the
+    'lyrics_in_terminal.providers' entry point group, e.g.
+
+        entry_points={'lyrics_in_terminal.providers': ['mysite = mypkg:MySite']}
+
+    the registry keeps rolling latency, success and parse failure stats
+    of every provider, a provider that is slow drops behind the others
+    and one that keeps failing is skipped until it is probed again
+'''
+from typing import List, Tuple
+from lyrics import CACHE_PATH
+from lyrics import local
+from lyrics import util
+
+import json
+import os
+import threading
+import time
+import warnings
+
+ENTRY_POINT_GROUP = 'lyrics_in_terminal.providers'
+# stats survive restarts, dot prefix keeps the file out of the file cache
+STATS_PATH = os.path.join(CACHE_PATH, '.providers.json')
+# seconds between writes of stats
+STATS_SAVE_INTERVAL = 30
+
+# weight of the latest lookup in rolling latency and success rate
+STATS_ALPHA = 0.2
+# a provider is broken below this success rate, after MIN_SAMPLES lookups
+MIN_SUCCESS = 0.2
+MIN_SAMPLES = 5
+# seconds before a broken provider is tried again
+PROBE_INTERVAL = 600
+# a provider this many times slower than the fastest healthy one
+# (and slower than SLOW_MIN seconds) is raced after the others
+SLOW_FACTOR = 3
+SLOW_MIN = 1.0
+
+
+class Provider:
+    ''' source of lyrics, subclasses override search, fetch and parse
+
+        inline providers find lyrics on the search result page itself,
+        they are tried before the others are raced. offline providers
+        are tried before the search page is requested at all
+    '''
+    name = None
+    header = util.HEADER
+    inline = False
+    offline = False
+
+    def search(self, track_name: str, search_html: str | None, path=None) -> str | None:
+        ''' returns url of lyrics page of track, None if there is none
+
+            search_html -> google result page of track, providers with
+                           their own search may ignore it, None for
+                           offline providers
+            path -> local audio file of track, if the player reports one
+        '''
+        return None
+
+    def fetch(self, url: str, cancel=None) -> str | None:
+        ''' returns html of url, None if it could not be downloaded
+
+            cancel -> threading.Event | aborts download when set
+        '''
+        html = util.get_html(url, self.header, cancel)
+        if isinstance(html, tuple):
+            return None
+        return html
+
+    def parse(self, html: str) -> List[str] | None:
+        ''' returns lines of lyrics in html, None if there are none
+        '''
+        return None
+
+
+class GoogleProvider(Provider):
+    name = 'google'
+    inline = True
+
+    def parse(self, html):
+        return util.parse_google(html)
+
+
+class LocalProvider(Provider):
+    ''' lyrics of audio file of track, from the player or the index
+        of music_dir
+    '''
+    name = 'local'
+    offline = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # path -> lyrics read by search, fetch hands them on
+        self.found = {}
+
+    def paths(self, track_name, path=None):
+        ''' yields audio files of track, the player's one first
+        '''
+        if path and os.path.isfile(path):
+            yield path
+
+        index = local.get_index(local.MUSIC_DIR)
+        if index is not None:
+            indexed = index.lookup(track_name)
+            if indexed is not None and indexed != path:
+                yield indexed
+
+    def search(self, track_name, search_html, path=None):
+        for path in self.paths(track_name, path):
+            text = local.read_lyrics(path)
+            if text is not None:
+                with self.lock:
+                    self.found[path] = text
+                return path
+        return None
+
+    def fetch(self, url, cancel=None):
+        with self.lock:
+            text = self.found.pop(url, None)
+        return text if text is not None else local.read_lyrics(url)
+
+    def parse(self, html):
+        return html.splitlines() or None
+
+
+class AZLyricsProvider(Provider):
+    name = 'azlyrics'
+    header = {'User-Agent': 'Mozilla/5.0 Firefox/70.0'}
+
+    def search(self, track_name, search_html, path=None):
+        match = util.AZ_URL_REGEX.search(search_html)
+        return match.group(1) if match else None
+
+    def parse(self, html):
+        return util.parse_azlyrics(html)
+
+
+class GeniusProvider(Provider):
+    name = 'genius'
+    header = {}
+
+    def search(self, track_name, search_html, path=None):
+        match = util.GENIUS_URL_REGEX.search(search_html)
+        return match.group(1) if match else None
+
+    def parse(self, html):
+        return util.parse_genius(html)
+
+
+BUILTIN = (LocalProvider, GoogleProvider, AZLyricsProvider, GeniusProvider)
+
+
+class ProviderStats:
+    ''' rolling stats of lookups of one provider
+    '''
+
+    def __init__(self, latency=None, success=1.0, samples=0,
+                 parse_failures=0, misses=0, last_attempt=0):
+        # seconds, of lookups that requested a page
+        self.latency = latency
+        self.success = success
+        self.samples = samples
+        self.parse_failures = parse_failures
+        # tracks the provider has no page for
+        self.misses = misses
+        # wall clock time, stats are kept across runs
+        self.last_attempt = last_attempt
+
+    def record(self, ok, latency=None, parse_failure=False):
+        self.samples += 1
+        self.success += STATS_ALPHA * ((1.0 if ok else 0.0) - self.success)
+        if latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += STATS_ALPHA * (latency - self.latency)
+        if parse_failure:
+            self.parse_failures += 1
+        self.last_attempt = time.time()
+
+    @property
+    def broken(self):
+        return self.samples >= MIN_SAMPLES and self.success < MIN_SUCCESS
+
+    def probe_due(self):
+        return time.time() - self.last_attempt >= PROBE_INTERVAL
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class Registry:
+    ''' registered providers and their stats
+    '''
+
+    def __init__(self, stats_path=STATS_PATH):
+        self.providers = {}
+        self.stats = {}
+        # entry point name -> error of plugins that failed to load
+        self.failed = {}
+        self.lock = threading.Lock()
+        self.stats_path = stats_path
+        self.saved_at = 0
+        self.load_stats()
+
+    def register(self, provider):
+        ''' adds provider (instance or class), replaces one of same name
+        '''
+        if isinstance(provider, type):
+            provider = provider()
+        if not provider.name:
+            raise ValueError(f'provider {provider!r} has no name')
+
+        with self.lock:
+            self.providers[provider.name] = provider
+            self.stats.setdefault(provider.name, ProviderStats())
+        return provider
+
+    def load_plugins(self):
+        ''' registers providers of installed entry points, a plugin
+            that fails to load is left out with a warning
+        '''
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:
+            # python 3.7
+            return
+
+        eps = entry_points()
+        if hasattr(eps, 'select'):
+            eps = eps.select(group=ENTRY_POINT_GROUP)
+        else:
+            eps = eps.get(ENTRY_POINT_GROUP, ())
+
+        for ep in eps:
+            try:
+                self.register(ep.load())
+            except Exception as e:
+                self.failed[ep.name] = f'{type(e).__name__}: {e}'
+                warnings.warn(f'lyrics provider plugin {ep.name!r} ({ep.value}) '
+                              f'failed to load: {self.failed[ep.name]}', RuntimeWarning)
+
+    def get(self, name):
+        return self.providers.get(name)
+
+    def names(self, priority=(), raced=False):
+        ''' returns names of registered providers,
+            those in priority first in its order, then the rest
+
+            raced -> only providers that fetch a page of their own
+        '''
+        rest = [n for n in self.providers if n not in priority]
+        names = [n for n in priority if n in self.providers] + rest
+        if raced:
+            names = [n for n in names if not self.providers[n].inline
+                     and not self.providers[n].offline]
+        return names
+
+    def order(self, priority=()) -> List[Provider]:
+        ''' returns providers to race, most preferred first
+
+            configured priority is kept among healthy providers, slow ones
+            follow and broken ones are left out unless a probe is due
+        '''
+        with self.lock:
+            names = self.names(priority, raced=True)
+            stats = {n: self.stats[n] for n in names}
+
+            latencies = [s.latency for s in stats.values()
+                         if not s.broken and s.latency is not None]
+            fastest = min(latencies, default=None)
+
+            healthy, slow, probes = [], [], []
+            for name in names:
+                s = stats[name]
+                if s.broken:
+                    if s.probe_due():
+                        probes.append(name)
+                elif (fastest is not None and s.latency is not None
+                      and s.latency > max(SLOW_MIN, fastest * SLOW_FACTOR)):
+                    slow.append(name)
+                else:
+                    healthy.append(name)
+
+            return [self.providers[n] for n in healthy + slow + probes]
+
+    def record(self, name, ok, latency=None, parse_failure=False):
+        with self.lock:
+            self.stats[name].record(ok, latency, parse_failure)
+        self.save_stats()
+
+    def record_miss(self, name):
+        with self.lock:
+            self.stats[name].misses += 1
+
+    def run(self, provider, track_name, search_html, cancel=None,
+            path=None) -> List[str] | None:
+        ''' looks up track with provider, records outcome in its stats
+            returns lyrics lines or None
+        '''
+        start = time.monotonic()
+        try:
+            if provider.inline:
+                html = search_html
+            else:
+                if provider.offline:
+                    url = provider.search(track_name, search_html, path=path)
+                else:
+                    url = provider.search(track_name, search_html)
+                if url is None:
+                    self.record_miss(provider.name)
+                    return None
+                html = provider.fetch(url, cancel)
+                if html is None:
+                    if cancel is None or not cancel.is_set():
+                        self.record(provider.name, False, time.monotonic() - start)
+                    return None
+
+            if cancel is not None and cancel.is_set():
+                return None
+            lines = provider.parse(html)
+        except Exception:
+            self.record(provider.name, False, time.monotonic() - start)
+            return None
+
+        latency = None if provider.inline else time.monotonic() - start
+        self.record(provider.name, lines is not None, latency,
+                    parse_failure=lines is None)
+        return lines
+
+    def lookup_offline(self, track_name, path=None,
+                       priority=()) -> Tuple[List[str] | None, str | None]:
+        ''' tries offline providers, returns (lyrics_lines, source)
+            path -> local audio file of track
+        '''
+        for name in self.names(priority):
+            provider = self.providers[name]
+            if provider.offline:
+                lines = self.run(provider, track_name, None, path=path)
+                if lines is not None:
+                    return lines, name
+
+        return None, None
+
+    def search(self, track_name, search_html, priority=(),
+               cancel=None) -> Tuple[List[str] | None, str | None]:
+        ''' tries inline providers on search page, then races the others
+            returns (lyrics_lines, source) of preferred successful parse
+
+            cancel -> threading.Event | stops the race when set
+        '''
+        for name in self.names(priority):
+            provider = self.providers[name]
+            if provider.inline:
+                lines = self.run(provider, track_name, search_html)
+                if lines is not None:
+                    return lines, name
+
+        return self.race(track_name, search_html, self.order(priority), cancel)
+
+    def race(self, track_name, search_html, providers,
+             stop=None) -> Tuple[List[str] | None, str | None]:
+        ''' looks up track with all providers at the same time
+            returns (lyrics_lines, source) of first successful parse
+
+            if more than one provider succeeds within RACE_WINDOW,
+            the one earlier in providers wins, others are cancelled
+
+            stop -> threading.Event | ends the race (no winner) when set
+        '''
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        priority = [p.name for p in providers]
+        cancel = threading.Event()
+
+        pool = util.get_race_pool()
+        pending = {pool.submit(self.run, p, track_name, search_html, cancel): p.name
+                   for p in providers}
+        results = {}
+        deadline = None
+
+        while pending:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            if stop is not None:
+                timeout = util.CANCEL_POLL if timeout is None else min(timeout, util.CANCEL_POLL)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if stop is not None and stop.is_set():
+                results.clear()
+                break
+            if not done:
+                if deadline is None or time.monotonic() < deadline:
+                    continue
+                # race window is over
+                break
+
+            for future in done:
+                results[pending.pop(future)] = future.result()
+
+            winner = next((s for s in priority if results.get(s) is not None), None)
+            if winner is None:
+                continue
+
+            # providers preferred over winner that have not answered yet
+            if all(s in results for s in priority[:priority.index(winner)]):
+                break
+            if deadline is None:
+                deadline = time.monotonic() + util.RACE_WINDOW
+
+        # stop losing downloads
+        cancel.set()
+        for future in pending:
+            future.cancel()
+
+        for source in priority:
+            if results.get(source) is not None:
+                return results[source], source
+
+        return None, None
+
+    def get_stats(self):
+        ''' returns {name: stats dict} of registered providers
+        '''
+        with self.lock:
+            return {n: dict(self.stats[n].to_dict(), broken=self.stats[n].broken)
+                    for n in self.providers}
+
+    def load_stats(self):
+        try:
+            with open(self.stats_path, encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        for name, values in data.items():
+            try:
+                self.stats[name] = ProviderStats(**values)
+            except TypeError:
+                # written by another version
+                pass
+
+    def save_stats(self, force=False):
+        ''' writes stats at most every STATS_SAVE_INTERVAL seconds
+        '''
+        from lyrics.cache import atomic_write
+
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.saved_at < STATS_SAVE_INTERVAL:
+                return
+            self.saved_at = now
+            data = json.dumps({n: s.to_dict() for n, s in self.stats.items()})
+
+        try:
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            atomic_write(self.stats_path, data)
+        except OSError:
+            pass
+
+
+# created on first lookup, entry points are not scanned for cache hits
+registry = None
+registry_lock = threading.Lock()
+
+
+def get_registry() -> Registry:
+    ''' returns shared registry with built-in and plugin providers
+    '''
+    global registry
+
+    with registry_lock:
+        if registry is None:
+            import atexit
+
+            registry = Registry()
+            for provider in BUILTIN:
+                registry.register(provider)
+            registry.load_plugins()
+            atexit.register(registry.save_stats, True)
+    return registry
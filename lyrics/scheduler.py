@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import select
+
+# longest sleep (ms) between polls while nothing changes
+POLL_MAX = 30000
+# while a track is playing, poll at most this many times slower than
+# interval, so a track change without events is not noticed too late
+PLAYING_BACKOFF = 4
+
+
+class Scheduler:
+    ''' decides how long the pager sleeps between updates
+
+        while nothing changes the poll interval doubles up to max_interval,
+        input or a change resets it. if the player backends send events
+        the pager sleeps until a key press or wake() from their threads
+
+        watched -> False if changes of the config file are not notified,
+                   its mtime is then polled as if there were no events,
+                   backing off to max_interval while nothing changes
+    '''
+
+    def __init__(self, interval, max_interval=POLL_MAX, events=False, watched=True):
+        self.set_interval(interval, max_interval)
+        # backends notify all changes, no polling needed
+        self.events = events
+        self.watched = watched
+
+        # self-pipe, written from other threads to interrupt select()
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+        os.set_blocking(self.write_fd, False)
+
+    def set_interval(self, interval, max_interval=POLL_MAX):
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.current = interval
+
+    def wake(self):
+        ''' interrupts wait(), safe to call from any thread or signal handler
+        '''
+        try:
+            os.write(self.write_fd, b'\0')
+        except BlockingIOError:
+            # pipe is full, wait() returns anyway
+            pass
+
+    def drain(self):
+        try:
+            while os.read(self.read_fd, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def reset(self):
+        self.current = self.interval
+
+    def backoff(self, playing=False):
+        ''' doubles poll interval after an update without changes
+        '''
+        limit = self.max_interval
+        # events report track changes, only polling has to notice them
+        if playing and not self.events:
+            limit = min(limit, self.interval * PLAYING_BACKOFF)
+        self.current = min(self.current * 2, limit)
+
+    def timeout(self, due=None):
+        ''' returns ms until next poll, None to sleep until woken
+            due -> ms until something on screen has to change
+        '''
+        timeout = None if self.events and self.watched else self.current
+        if due is not None:
+            timeout = due if timeout is None else min(timeout, due)
+        return timeout
+
+    def wait(self, fd=None, timeout=None):
+        ''' sleeps until fd (if given) is readable, wake() is called or
+            timeout (ms) passes, returns True if it did not time out
+        '''
+        fds = [self.read_fd] if fd is None else [fd, self.read_fd]
+        seconds = None if timeout is None else timeout / 1000
+        ready, _, _ = select.select(fds, [], [], seconds)
+
+        if self.read_fd in ready:
+            self.drain()
+        return bool(ready)
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from bisect import bisect_right
+
+import re
+
+# find modes, cycled in find prompt
+PLAIN = 'plain'
+REGEX = 'regex'
+FUZZY = 'fuzzy'
+MODES = (PLAIN, REGEX, FUZZY)
+
+
+def fold(line):
+    ''' returns lowercase line with same length as line, so offsets
+        in both are the same
+    '''
+    lowered = line.lower()
+    if len(lowered) == len(line):
+        return lowered
+    # a few characters lowercase into several ('İ' -> 'i̇')
+    return ''.join(char.lower()[:1] or char for char in line)
+
+
+def to_runs(positions):
+    ''' returns list of (start, end) runs of sorted character positions
+    '''
+    runs = []
+    for pos in positions:
+        if runs and runs[-1][1] == pos:
+            runs[-1] = (runs[-1][0], pos + 1)
+        else:
+            runs.append((pos, pos + 1))
+    return runs
+
+
+class SearchIndex:
+    ''' case-insensitive search over rendered lyrics lines
+
+        built once per rendered text, lines are lowercased and joined
+        with their start offsets so a plain find is a str.find scan
+        over one string instead of a scan of every line
+    '''
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.lower = [fold(line) for line in lines]
+        self.text = '\n'.join(self.lower)
+
+        # offset of first character of every line in text
+        self.offsets = []
+        offset = 0
+        for line in self.lower:
+            self.offsets.append(offset)
+            offset += len(line) + 1
+
+    def find(self, query, mode=PLAIN):
+        ''' returns list of (line number, [(start, end), ...]) of lines
+            matching query, spans are character runs to highlight
+
+            raises re.error if query is not a valid regex in REGEX mode
+        '''
+        if not query:
+            return []
+        if mode == REGEX:
+            return self.find_regex(query)
+        if mode == FUZZY:
+            return self.find_fuzzy(query)
+        return self.find_plain(query)
+
+    def find_plain(self, query):
+        query = fold(query)
+        matches = {}
+
+        pos = self.text.find(query)
+        while pos != -1:
+            line_num = bisect_right(self.offsets, pos) - 1
+            start = pos - self.offsets[line_num]
+            matches.setdefault(line_num, []).append((start, start + len(query)))
+            pos = self.text.find(query, pos + len(query))
+
+        return sorted(matches.items())
+
+    def find_regex(self, query):
+        regex = re.compile(query, re.IGNORECASE)
+        matches = []
+
+        for line_num, line in enumerate(self.lines):
+            spans = [m.span() for m in regex.finditer(line) if m.end() > m.start()]
+            if spans:
+                matches.append((line_num, spans))
+
+        return matches
+
+    def find_fuzzy(self, query):
+        # characters of query in order, anywhere in line
+        chars = fold(query).replace(' ', '')
+        if not chars:
+            return []
+
+        matches = []
+        for line_num, line in enumerate(self.lower):
+            positions = []
+            pos = 0
+            for char in chars:
+                pos = line.find(char, pos)
+                if pos == -1:
+                    break
+                positions.append(pos)
+                pos += 1
+            else:
+                matches.append((line_num, to_runs(positions)))
+
+        return matches
@@ -1,6 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+from lyrics import lrc
 from lyrics import util
+from lyrics.cache import LRUCache
+
+FETCHING_TEXT = 'fetching…'
+
+# rendered (wrapped + aligned) lyrics,
+# keyed by (track key, width, alignment, wrap)
+rendered = LRUCache(maxsize=32)
 
 
 class Track:
@@ -8,7 +16,8 @@ class Track:
                  artist='',
                  title='',
                  align=1,
-                 width=0):
+                 width=0,
+                 sources=None):
 
         self.title = title
         self.artist = artist
@@ -16,10 +25,18 @@ class Track:
         self.width = width
         self.length = 0
         self.lyrics = []
+        # lyrics as fetched, with LRC time stamps
+        self.raw = []
         self.source = None
         self.album = None
         self.trackid = None
-        self.sources = ['azlyrics', 'genius']
+        # audio file of track, if player reports a local one
+        self.path = None
+        # lrc.SyncedLyrics if lyrics are time-stamped
+        self.synced = None
+        # first rendered row of every lyrics line, set by get_lines
+        self.rows = []
+        self.sources = list(sources or util.SOURCE_PRIORITY)
 
     def __str__(self):
         ''' trackname in format "{artist} - {title}"
@@ -49,59 +66,138 @@ class Track:
 
         return trackinfo
 
-    def update(self, artist, title, album, trackid):
+    def update(self, artist, title, album, trackid, path=None):
         ''' update currently playing track info, (change track)
         '''
         self.artist = artist
         self.title = title
         self.album = album
         self.trackid = trackid
+        self.path = path
         # self.art_url = art_url
         # self.get_lyrics()
 
-    def get_lyrics(self, source, cycle_source=False, cache=True):
-        ''' fetch lyrics off the internet
+    def select_source(self, source, cycle_source=False, cache=True):
+        ''' returns (source, cache) to fetch lyrics with,
+            advances to next source if cycle_source is True
         '''
         if self.source is None or self.source == 'cache':
             self.source = source or self.sources[0]
 
-        if cycle_source is True and self.source not in self.sources:
-            self.source = self.sources[0]
+        # installed plugin providers are cycled after configured ones
+        sources = self.sources
+        if cycle_source:
+            from lyrics.providers import get_registry
+            sources = get_registry().names(self.sources, raced=True) or self.sources
+
+        if cycle_source is True and self.source not in sources:
+            self.source = sources[0]
 
         if cycle_source:
-            curr_source = self.sources.index(self.source)
-            next_source = (curr_source + 1) % len(self.sources)
-            source = self.sources[next_source]
+            curr_source = sources.index(self.source)
+            next_source = (curr_source + 1) % len(sources)
+            source = sources[next_source]
             cache = False
         else:
             source = 'any'
 
-        self.lyrics, self.source = util.get_lyrics(self.track_name, source, cache=cache)
+        return source, cache
+
+    @property
+    def key(self):
+        ''' cache key of track
+        '''
+        return util.get_key(self.track_name)
+
+    def invalidate(self):
+        ''' drops rendered text of track, (lyrics changed)
+        '''
+        key = self.key
+        rendered.invalidate(lambda k: k[0] == key)
+
+    def set_lyrics(self, lyrics, source):
+        ''' replace lyrics of track with fetched lyrics
+        '''
+        self.invalidate()
+        self.raw = lyrics
+        # time stamps are kept in cache, only text is shown
+        self.synced = lrc.parse(lyrics) if lrc.is_lrc(lyrics) else None
+        if self.synced is not None and len(self.synced) > 0:
+            lyrics = self.synced.lines
+
+        self.lyrics, self.source = lyrics, source
         self.width = len(max(self.lyrics, key=len))
         self.length = len(self.lyrics)
 
+    def set_fetching(self):
+        ''' show placeholder text while lyrics are fetched in background
+        '''
+        self.invalidate()
+        self.synced = None
+        self.raw = self.lyrics = [FETCHING_TEXT]
+        self.width = len(FETCHING_TEXT)
+        self.length = 1
+
+    def get_lyrics(self, source, cycle_source=False, cache=True):
+        ''' fetch lyrics off the internet
+        '''
+        source, cache = self.select_source(source, cycle_source, cache)
+        self.set_lyrics(*util.get_lyrics(self.track_name, source,
+                                         cache=cache, priority=self.sources,
+                                         album=self.album, path=self.path,
+                                         trackid=self.trackid))
+
     def get_text(self, wrap=False, width=0):
         ''' returns lyrics text seperated by '\\n'
         '''
-        if wrap:
-            lyrics=util.wrap_text(self.lyrics, width)
-        else:
-            lyrics=self.lyrics
+        lyrics = self.get_lines(wrap, width)
+        return '\n'.join(line for line in lyrics)
 
-        self.width = len(max(lyrics, key=len))
+    def get_lines(self, wrap=False, width=0):
+        ''' returns list of wrapped and aligned lines of lyrics,
+            served from rendered cache when possible
+        '''
+        cache_key = (self.key, width if wrap else 0, self.alignment, wrap)
+        cached = rendered.get(cache_key)
+
+        if cached is None:
+            if wrap:
+                lyrics = []
+                rows = []
+                for line in self.lyrics:
+                    rows.append(len(lyrics))
+                    lyrics += util.wrap_text([line], width)
+            else:
+                lyrics = self.lyrics
+                rows = range(len(lyrics))
+
+            lyrics_width = len(max(lyrics, key=len))
+            cached = (util.align(lyrics, lyrics_width, self.alignment), lyrics_width, rows)
+            rendered.put(cache_key, cached)
+
+        lyrics, self.width, self.rows = cached
         self.length = len(lyrics)
 
-        lyrics = util.align(lyrics, self.width, self.alignment)
+        return lyrics
+
+    def line_rows(self, index):
+        ''' returns range of rendered rows of lyrics line index
+        '''
+        if index < 0 or index >= len(self.rows):
+            return range(0)
+
+        end = self.rows[index + 1] if index + 1 < len(self.rows) else self.length
+        return range(self.rows[index], end)
 
-        return '\n'.join(line for line in lyrics)
-    
     def edit_lyrics(self):
         ''' open lyrics file in text editor present in CONFIG path
         '''
+        self.invalidate()
         util.edit_lyrics(self.track_name)
 
 
     def delete_lyrics(self):
         ''' delete lyrics file
         '''
+        self.invalidate()
         return util.delete_lyrics(self.track_name)
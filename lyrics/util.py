@@ -2,15 +2,21 @@
 # -*- coding: utf-8 -*-
 
 from typing import List, Tuple
-from urllib.parse import quote
+from urllib.parse import quote, urlsplit
+from html import unescape
+from collections import deque, namedtuple
 from textwrap import wrap
 from lyrics import CACHE_PATH
+from lyrics import cache as lyrics_cache
 
-from subprocess import run
 import os
-import tempfile
+import threading
+import time
 import re
-import requests
+import unicodedata
+
+# requests is imported by get_session on first network access,
+# lyrics served from cache never load it
 
 
 url = 'https://www.google.com/search?q='
@@ -19,69 +25,276 @@ HEADER = {
 }
 
 CLASS_NAME = r'\w{5,7} \w{4,5} \w{5,7}'  # dependent on User-Agent
+GOOGLE_REGEX = re.compile(r'<div class="{}">([^>]*?)</div>'.format(CLASS_NAME), re.S)
+AZ_URL_REGEX = re.compile(r'(http[s]?://www.azlyrics.com/lyrics(?:.*?))&amp')
+GENIUS_URL_REGEX = re.compile(r'(http[s]?://genius.com/(?!albums)(?:.*?))&amp')
+BRACKETS_REGEX = re.compile(r'(\[.*\].*)|(\(.*\).*)')
+KEY_STRIP_REGEX = re.compile(r'\s|\/|\\|\.')
+
+# bumped when get_key changes, keys stored elsewhere are rebuilt
+KEY_VERSION = 3
+# versions of a song with the same lyrics, "(Remastered 2011)", "- Live at ..."
+VARIANT = (r'(?:\d{4}\s+)?(?:digital(?:ly)?\s+)?'
+           r'(?:remaster(?:ed)?|live|explicit|clean|radio edit|mono|stereo'
+           r'|(?:single|album) version)\b')
+VARIANT_BRACKETS_REGEX = re.compile(r'\s*[(\[]\s*' + VARIANT + r'[^)\]]*[)\]]')
+VARIANT_SUFFIX_REGEX = re.compile(r'\s+-\s+' + VARIANT + r'.*$')
+# featured artists, in brackets anywhere. unbracketed only in their
+# unambiguous forms, "Ten Ft Tall" and "Little Feat" are left alone
+FEAT_BRACKETS_REGEX = re.compile(r'\s*[(\[]\s*(?:feat|ft|featuring)\b[^)\]]*[)\]]')
+FEAT_ARTIST_REGEX = re.compile(r'\s+(?:(?:feat|ft)\.|featuring\s).*$')
+FEAT_TITLE_REGEX = re.compile(r'\s+feat\..*$')
+KEY_PUNCTUATION_REGEX = re.compile(r'[^\w\s]|_')
+# player track ids that name a recording, not a playlist position
+STABLE_TRACKID_REGEX = re.compile(r'spotify[:/]track[:/]')
+
+GENIUS_CONTAINER = 'data-lyrics-container="true"'
+AZ_COMMENT = 'Sorry about that. -->'
+# tags without end tag
+VOID_TAGS = {'br', 'img', 'hr', 'input', 'meta', 'link', 'wbr', 'source'}
+# start/end tag or comment, see extract_lines()
+TAG_REGEX = re.compile(r'<!--.*?-->|<(/?)([a-zA-Z][^\s/>]*)([^>]*)>', re.S)
+EXCLUDE_REGEX = re.compile(r'data-exclude-from-selection\s*=\s*["\']?true')
 EDITOR = os.environ.get('EDITOR', 'nano')
 initial_text = b"Add lyrics here!"     # placeholder text for lyrics file
+NOT_FOUND = 'lyrics not found! :( for'
+
+# default order of raced providers, see lyrics.providers
+SOURCE_PRIORITY = ('azlyrics', 'genius')
+# seconds to wait for a higher priority source after a lower one has won
+RACE_WINDOW = 0.25
+# seconds between checks of a cancelled lookup while sources are raced
+CANCEL_POLL = 0.1
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (3.05, 10)
+RETRIES = 2
+RETRY_BACKOFF = 0.3
+
+# minimum seconds between requests to the same host, 0 disables
+RATE_LIMIT = 0
+rate_lock = threading.Lock()
+# host -> earliest time of next request
+next_request = {}
+
+# one pooled keep-alive session per host
+sessions = {}
+sessions_lock = threading.Lock()
+
+Timing = namedtuple('Timing', ['host', 'url', 'status', 'response', 'total'])
+# most recent requests, response -> time to headers, total -> including body
+timings = deque(maxlen=100)
+
+# created on first race, concurrent.futures is not needed for cache hits
+race_pool = None
+race_pool_lock = threading.Lock()
+
+
+class Cancelled(Exception):
+    pass
+
+
+class SingleFlight:
+    ''' runs one call per key at a time, callers of a key that is
+        already running wait for it and share its result
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [done event, result, exception]
+        self.calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = [threading.Event(), None, None]
+
+        if not leader:
+            call[0].wait()
+            if isinstance(call[2], Cancelled):
+                # cancelled by its own caller, not by this one
+                return self.do(key, func, *args, **kwargs)
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+
+        try:
+            call[1] = func(*args, **kwargs)
+            return call[1]
+        except BaseException as e:
+            call[2] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call[0].set()
+
+
+# lyrics fetches in flight, keyed by (track key, source)
+flights = SingleFlight()
 
 
 def query(track_name):
     '''encodes search query
     '''
-    track_name = re.sub(r'(\[.*\].*)|(\(.*\).*)', '', track_name).strip()
+    track_name = BRACKETS_REGEX.sub('', track_name).strip()
     return quote(track_name + ' lyrics')
 
 
-def get_html(url, header=HEADER) -> str | Tuple[str, Exception]:
-    ''' returns html text from given url
-    '''
+def accept_encoding():
     try:
-        resp = requests.get(url, headers=header)
-        resp.raise_for_status()
-    except Exception as e:
-        # TODO: add error logging to file
-        return 'Error:' + str(e), e
+        # requests only decodes brotli responses if a brotli module is present
+        import brotli
+        return 'gzip, deflate, br'
+    except ImportError:
+        return 'gzip, deflate'
+
+
+def get_session(host) -> 'requests.Session':
+    ''' returns shared keep-alive session for host,
+        with bounded retries and exponential backoff
+    '''
+    with sessions_lock:
+        session = sessions.get(host)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(total=RETRIES, backoff_factor=RETRY_BACKOFF,
+                          status_forcelist=(429, 500, 502, 503, 504))
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4,
+                                  max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['Accept-Encoding'] = accept_encoding()
+            sessions[host] = session
+    return session
+
+
+def get_race_pool():
+    ''' returns shared thread pool providers are raced on
+    '''
+    global race_pool
+
+    with race_pool_lock:
+        if race_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            race_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='lyrics-race')
+    return race_pool
 
-    return resp.text
 
+def set_rate_limit(interval):
+    ''' limits requests to one per interval seconds per host
+    '''
+    global RATE_LIMIT
+    RATE_LIMIT = interval
 
-def get_az_html(html: str) -> str | None:
-    ''' finds azlyrics website link and
-        returns html text from azlyrics
 
-        if azlyrics link not found returns None
+def throttle(host):
+    ''' waits until host may be requested again under RATE_LIMIT
     '''
-    regex = re.compile(r'(http[s]?://www.azlyrics.com/lyrics(?:.*?))&amp')
-    az_url = regex.search(html)
+    if RATE_LIMIT <= 0:
+        return
 
-    if az_url == None:
-        return None
+    with rate_lock:
+        now = time.monotonic()
+        start = max(now, next_request.get(host, 0))
+        next_request[host] = start + RATE_LIMIT
 
-    header = {'User-Agent': 'Mozilla/5.0 Firefox/70.0'}
-    az_url = az_url.group(1)
-    az_html = get_html(az_url, header)
+    if start > now:
+        time.sleep(start - now)
 
-    if isinstance(az_html, tuple):
-        return None
-    return az_html
+
+def get_timings() -> List[Timing]:
+    ''' returns timings of recent requests, oldest first
+    '''
+    return list(timings)
 
 
-def get_genius_html(html: str) -> str | None:
-    ''' finds genius website link and
-        returns html text from genius
+def get_html(url, header=HEADER, cancel=None) -> str | Tuple[str, Exception]:
+    ''' returns html text from given url
 
-        if genius link not found returns None
+        cancel -> threading.Event | aborts download when set
     '''
-    regex = re.compile(r'(http[s]?://genius.com/(?!albums)(?:.*?))&amp')
-    gns_url = regex.search(html)
+    host = urlsplit(url).netloc
+    throttle(host)
 
-    if gns_url == None:
-        return None
+    start = time.monotonic()
+    resp = None
+    try:
+        resp = get_session(host).get(url, headers=header, timeout=TIMEOUT,
+                                     stream=cancel is not None)
+        resp.raise_for_status()
+
+        if cancel is None:
+            text = resp.text
+        else:
+            chunks = []
+            for chunk in resp.iter_content(chunk_size=16384):
+                if cancel.is_set():
+                    resp.close()
+                    raise Cancelled(url)
+                chunks.append(chunk)
+            text = b''.join(chunks).decode(resp.encoding or 'utf-8', errors='replace')
+    except Exception as e:
+        # TODO: add error logging to file
+        return 'Error:' + str(e), e
+    finally:
+        timings.append(Timing(host, url,
+                              resp.status_code if resp is not None else None,
+                              resp.elapsed.total_seconds() if resp is not None else None,
+                              time.monotonic() - start))
 
-    gns_url = gns_url.group(1)
-    gns_html = get_html(gns_url, header={})
+    return text
 
-    if isinstance(gns_html, tuple):
-        return None
-    return gns_html
+
+def extract_lines(html, start=0, depth=0):
+    ''' single-pass extractor of text lines from the html element at start
+
+        <br> starts a new line, html entities are decoded, stops once the
+        element it started in is closed and skips subtrees marked with
+        data-exclude-from-selection (ads). depth=1 extracts from inside
+        an element, up to its end tag
+    '''
+    lines = ['']
+    skip_depth = None
+    pos = start
+
+    for match in TAG_REGEX.finditer(html, start):
+        if skip_depth is None and match.start() > pos:
+            # line breaks come from <br>, source newlines are formatting
+            text = html[pos:match.start()].replace('\r', '').replace('\n', '')
+            lines[-1] += unescape(text)
+        pos = match.end()
+
+        closing, tag, attrs = match.groups()
+        if tag is None:
+            # comment
+            continue
+        tag = tag.lower()
+
+        if closing:
+            if tag in VOID_TAGS:
+                continue
+            if skip_depth == depth:
+                skip_depth = None
+            depth -= 1
+            if depth <= 0:
+                return lines
+        elif tag == 'br':
+            lines.append('')
+        elif tag not in VOID_TAGS and not attrs.endswith('/'):
+            depth += 1
+            if skip_depth is None and EXCLUDE_REGEX.search(attrs):
+                skip_depth = depth
+
+    if skip_depth is None:
+        lines[-1] += unescape(html[pos:].replace('\r', '').replace('\n', ''))
+    return lines
 
 
 def parse_genius(html: str | None) -> List[str] | None:
@@ -91,25 +304,25 @@ def parse_genius(html: str | None) -> List[str] | None:
     if html == None:
         return None
 
-    gns_regex = re.compile(
-        '<div data-lyrics-container="true" (?:.*?)(>.*?<)/div>', re.S)
-    ly = gns_regex.findall(html)
-
-    if ly == None:
+    lines = []
+    pos = html.find(GENIUS_CONTAINER)
+    while pos != -1:
+        # start of <div data-lyrics-container="true" ...>
+        start = html.rfind('<', 0, pos)
+        lines += extract_lines(html, start)
+        pos = html.find(GENIUS_CONTAINER, pos + len(GENIUS_CONTAINER))
+
+    lines = [line for line in lines if line.strip()]
+    if not lines:
         # Genius lyrics not found
         return None
 
-    lyrics_lines = ''
-    for ly_section in ly:
-        ly_section = ly_section.replace('&#x27;', "'")
-        line_regex = re.compile(r'>([^<]+?)<', re.S)
-        lines = line_regex.findall(ly_section)
-        lyrics_lines += "\n".join(lines)
-
-    lyrics_lines = re.sub(r'\n{2,}', '\n', lyrics_lines)
-    lyrics_lines = lyrics_lines.replace('\n[', '\n\n[').replace('&quot;', '"')
-
-    lyrics_lines = lyrics_lines.split('\n')
+    lyrics_lines = lines[:1]
+    for line in lines[1:]:
+        if line.startswith('['):
+            # blank line before [Verse], [Chorus]...
+            lyrics_lines.append('')
+        lyrics_lines.append(line)
 
     return lyrics_lines
 
@@ -118,39 +331,33 @@ def parse_azlyrics(html: str | None) -> List[str] | None:
     ''' parses lyrics from azlyrics html
         returns list if strings of lyrics
 
-        if lyrics not found returns error string
+        if lyrics not found returns None
     '''
     if html == None:
         return None
 
-    az_regex = re.compile(
-        r'Sorry about that. -->(.*)(?:<script>(.*))<!-- MxM banner -->', re.S)
-
-    ly = az_regex.search(html)
-    if ly == None:
+    # lyrics follow the comment inside an unnamed <div>
+    pos = html.find(AZ_COMMENT)
+    if pos == -1:
         # Az lyrics not found
         return None
 
-    # remove stray html tags
-    ly = re.sub(r'<[/]?\w*?>', '', ly.group(1)).strip()
+    lines = extract_lines(html, pos + len(AZ_COMMENT), depth=1)
 
-    # replace html entities
-    rep = {'&quot;': '\"', '&amp;': '&', '\r': ''}
-    replace_patten = '|'.join(rep.keys())
-    ly = re.sub(replace_patten, lambda match: rep[match.group(0)], ly)
-    lyrics_lines = ly.split('\n')
+    # strip leading and trailing blank lines
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    while lines and not lines[-1].strip():
+        lines.pop()
 
-    return lyrics_lines
+    return lines or None
 
 
 def parse_google(html: str) -> List[str] | None:
     ''' parses google result html
         returns list of strings or None if no lyrics found
     '''
-    html_regex = re.compile(
-        r'<div class="{}">([^>]*?)</div>'.format(CLASS_NAME), re.S)
-
-    text_list = html_regex.findall(html)
+    text_list = GOOGLE_REGEX.findall(html)
 
     if len(text_list) < 2:
         # No google result found!
@@ -161,7 +368,7 @@ def parse_google(html: str) -> List[str] | None:
         # lyrics must be multiline,
         # ignore the artist info below lyrics
         if l.count('\n') > 2:
-            lyrics_lines += l.split('\n')
+            lyrics_lines += unescape(l).split('\n')
     if len(lyrics_lines) < 5:
         # too short match for lyrics
         return None
@@ -169,107 +376,265 @@ def parse_google(html: str) -> List[str] | None:
     return lyrics_lines
 
 
+def normalize(text, title=False):
+    ''' returns text casefolded, without punctuation, featured artists
+        and (for titles) version suffixes
+    '''
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = FEAT_BRACKETS_REGEX.sub('', text)
+    text = (FEAT_TITLE_REGEX if title else FEAT_ARTIST_REGEX).sub('', text)
+    if title:
+        text = VARIANT_BRACKETS_REGEX.sub('', text)
+        text = VARIANT_SUFFIX_REGEX.sub('', text)
+    text = KEY_PUNCTUATION_REGEX.sub('', text)
+    return ' '.join(text.split())
+
+
+def get_key(track_name):
+    ''' returns canonical cache key of track name
+
+        >>> get_key('Artist feat. X - Song (Remastered 2011)')
+        'artist - song'
+        >>> get_key('Artist ft. X - Song [feat. Y]')
+        'artist - song'
+        >>> get_key('Artist - Song feat. Y - Live at Wembley')
+        'artist - song'
+        >>> get_key('Artist - Ten Ft Tall')
+        'artist - ten ft tall'
+        >>> get_key('Artist - 6 ft under')
+        'artist - 6 ft under'
+        >>> get_key('Little Feat Band - Willin')
+        'little feat band - willin'
+    '''
+    artist, sep, title = track_name.partition(' - ')
+    if not sep:
+        return normalize(track_name, title=True)
+    return normalize(artist) + ' - ' + normalize(title, title=True)
+
+
+def legacy_key(track_name):
+    ''' returns cache key of track name used before KEY_VERSION 2
+    '''
+    # removing text in brackets [] ()
+    key = BRACKETS_REGEX.sub('', track_name).strip()
+    return KEY_STRIP_REGEX.sub('', key)
+
+
+def trackid_alias(trackid):
+    ''' returns alias of player track id, None if it does not
+        identify a recording
+    '''
+    if trackid and STABLE_TRACKID_REGEX.search(str(trackid)):
+        return 'trackid:' + str(trackid)
+    return None
+
+
+def resolve_key(track_name, trackid=None):
+    ''' returns (key, Entry) of cached lyrics of track, found under its
+        canonical key, an alias of it or its trackid, or a key written
+        by an older version. Entry is None if track is not cached
+    '''
+    key = get_key(track_name)
+    store = lyrics_cache.get_store()
+
+    entry = lyrics_cache.memory.get(key)
+    if entry is None:
+        entry = store.get(key)
+    if entry is not None:
+        return key, entry
+
+    alias = trackid_alias(trackid)
+    targets = [store.get_alias(key)]
+    if alias is not None:
+        targets.append(store.get_alias(alias))
+
+    for target in targets:
+        if target is not None and target != key:
+            entry = store.get(target)
+            if entry is not None:
+                store.put_alias(key, target)
+                return target, entry
+
+    legacy = legacy_key(track_name)
+    if legacy and legacy != key:
+        entry = store.get(legacy)
+        if entry is not None:
+            store.put_alias(key, legacy)
+            return legacy, entry
+
+    return key, None
+
+
+def remember_alias(key, trackid):
+    ''' points trackid (if it identifies a recording) at cached lyrics key
+    '''
+    alias = trackid_alias(trackid)
+    if alias is not None:
+        lyrics_cache.get_store().put_alias(alias, key)
+
+
 def get_filename(track_name):
     '''returns name of cache file name from track name with correct format
     '''
-    # removing text in brackets [] ()
-    filename = re.sub(r'(\[.*\].*)|(\(.*\).*)', '', track_name).strip()
-    filename = re.sub(r'\s|\/|\\|\.', '', filename)
-    return os.path.join(CACHE_PATH, filename)
+    return os.path.join(CACHE_PATH, get_key(track_name))
 
 
-def get_lyrics(track_name: str, source: str = 'any', cache: bool = True) -> Tuple[List[str], str | None]:
+def get_lyrics(track_name: str, source: str = 'any', cache: bool = True,
+               priority=SOURCE_PRIORITY, album=None, path=None,
+               trackid=None, cancel=None) -> Tuple[List[str], str | None]:
     ''' returns tuple of list of strings with lines of lyrics and found source
-        also reads/write to cache file | if cache=True
+        also reads/write to lyrics cache | if cache=True
 
         track_name -> track name in format "artist - title"
-        source -> source to fetch lyrics from ('google', 'azlyrics', 'genius', 'any')
-        cache -> bool | whether to check lyrics from cache or not.
+        source -> provider to fetch lyrics from ('google', 'azlyrics', 'genius', ...) or 'any'
+        cache -> bool | whether to check lyrics (and recorded misses) from cache or not.
+        priority -> sources raced in order of preference when source is 'any'
+        album -> album name, stored along with cached lyrics
+        path -> local audio file of track, its lyrics (sidecar .lrc, tags) are used
+                before any source
+        trackid -> player track id, variants of a track name it was played
+                   under share one cache entry
+        cancel -> threading.Event | stops downloads when set, raises Cancelled
+                  if the lookup was stopped before lyrics were found
     '''
-    filepath = get_filename(track_name)
-
-    if not os.path.isdir(CACHE_PATH):
-        os.makedirs(CACHE_PATH)
+    key = get_key(track_name)
+    store = lyrics_cache.get_store()
 
     lyrics_lines = None
     # If cache enabled, then return cached lyrics
-    if os.path.isfile(filepath) and cache:
-        # cache lyrics exist
-        with open(filepath) as file:
-            lyrics_lines = file.read().splitlines()
-        return lyrics_lines, 'cache'
+    if cache:
+        found_key, entry = resolve_key(track_name, trackid)
+        if entry is not None:
+            lyrics_cache.memory.put(key, entry)
+            remember_alias(found_key, trackid)
+            # cache lyrics exist
+            return entry.lyrics, 'cache'
+
+    if source == 'any' or source == 'local':
+        # files on disk, tracks we already have lyrics for never go online
+        from lyrics.providers import get_registry
+
+        lyrics_lines, found_source = get_registry().lookup_offline(track_name, path, priority)
+        if lyrics_lines is not None:
+            store.put(key, lyrics_lines, track=track_name, album=album, source=found_source)
+            lyrics_cache.memory.invalidate(lambda k: k == key)
+            remember_alias(key, trackid)
+            return lyrics_lines, found_source
+
+    if cache:
+        # recently failed lookups are answered locally until their ttl runs out
+        miss = store.get_miss(key)
+        if miss is not None and not lyrics_cache.miss_expired(miss):
+            if miss.error:
+                return [miss.error], source
+            return [NOT_FOUND, source], source
+
+    # concurrent lookups of a track in this process share one fetch
+    return flights.do((key, source), fetch_lyrics, track_name, source,
+                      cache, priority, album, trackid, cancel)
+
+
+def fetch_lyrics(track_name, source='any', cache=True, priority=SOURCE_PRIORITY,
+                 album=None, trackid=None, cancel=None):
+    ''' fetches lyrics of track from source and stores them in cache,
+        see get_lyrics
+
+        holds fetch lock of track, so a process that waited for another
+        one fetching the same track reads its result from cache instead
+    '''
+    key = get_key(track_name)
+    store = lyrics_cache.get_store()
+
+    with lyrics_cache.fetch_lock(key, source, cancel):
+        if cancel is not None and cancel.is_set():
+            raise Cancelled(track_name)
+        if cache:
+            entry = store.get(key)
+            if entry is not None:
+                lyrics_cache.memory.put(key, entry)
+                return entry.lyrics, 'cache'
+
+        return search_lyrics(track_name, key, source, priority, album, trackid, cancel)
+
+
+def search_lyrics(track_name, key, source, priority, album, trackid=None, cancel=None):
+    ''' searches source for lyrics of track, records result in cache
+    '''
+    lyrics_lines = None
+    store = lyrics_cache.get_store()
 
     search_url = url + query(track_name)
-    html = get_html(search_url)
+    html = get_html(search_url, cancel=cancel)
+    if cancel is not None and cancel.is_set():
+        raise Cancelled(track_name)
     if isinstance(html, tuple):
         err = html[0]
+        store.put_miss(key, err)
         return [err], source
 
-    found_source = None
-    if source == 'google' or source == 'any':
-        lyrics_lines = parse_google(html)
-        found_source = 'google' if lyrics_lines is not None else None
-
-    if source == 'azlyrics' or (source == 'any' and lyrics_lines is None):
-        az_html = get_az_html(html)
-        lyrics_lines = parse_azlyrics(az_html)
-        found_source = 'azlyrics' if lyrics_lines is not None else None
+    # providers build on this module
+    from lyrics.providers import get_registry
 
-    if source == 'genius' or (source == 'any' and lyrics_lines is None):
-        gns_html = get_genius_html(html)
-        lyrics_lines = parse_genius(gns_html)
-        found_source = 'genius' if lyrics_lines is not None else None
+    registry = get_registry()
+    found_source = None
+    if source == 'any':
+        lyrics_lines, found_source = registry.search(track_name, html, priority, cancel)
+    elif registry.get(source) is not None:
+        lyrics_lines = registry.run(registry.get(source), track_name, html, cancel)
+        found_source = source if lyrics_lines is not None else None
 
     if lyrics_lines is None:
-        return ['lyrics not found! :( for', source], source
+        if cancel is not None and cancel.is_set():
+            # not a miss, the track was not looked up to the end
+            raise Cancelled(track_name)
+        store.put_miss(key)
+        return [NOT_FOUND, source], source
 
-    # TODO: replace all html entities with ASCII instead of just &amp;
-    text = map(lambda x: x.replace('&amp;', '&') + '\n', lyrics_lines)
-
-    with open(filepath, 'w') as file:
-        file.writelines(text)
+    store.put(key, lyrics_lines, track=track_name, album=album,
+              source=found_source or source)
+    lyrics_cache.memory.invalidate(lambda k: k == key)
+    remember_alias(key, trackid)
 
     return lyrics_lines, found_source or source
 
 
 def edit_lyrics(track_name):
-    ''' opens local lyrics file in $EDITOR to edit
+    ''' opens cached lyrics in $EDITOR to edit
         if $EDITOR is not set, defaults to nano
 
-        if local lyrics file does not exists, 
-        then opens temp file
+        if lyrics are not cached yet, opens placeholder text
     '''
-    filepath = get_filename(track_name)
+    from subprocess import run
+    import tempfile
 
-    if os.path.isfile(filepath):
-        # lyrics exist
-        # open text file
-        run([EDITOR, filepath], check=True)
-    else:
-        # open temp file
-        with tempfile.NamedTemporaryFile(prefix=track_name, suffix=".tmp") as tf:
+    key, entry = resolve_key(track_name)
+    store = lyrics_cache.get_store()
+
+    with tempfile.NamedTemporaryFile(prefix=key, suffix=".tmp") as tf:
+        if entry is not None:
+            tf.write('\n'.join(entry.lyrics).encode('utf-8'))
+        else:
             tf.write(initial_text)
-            tf.flush()
-            run([EDITOR, tf.name])
-            tf.seek(0)
-            edited_lyrics = tf.read().decode('utf-8')
-        # save temp file as lyrics cache
-        with open(filepath, 'w') as file:
-            file.writelines(edited_lyrics)
+        tf.flush()
+        run([EDITOR, tf.name], check=entry is not None)
+        # editors may replace the file instead of writing in place
+        with open(tf.name, 'rb') as file:
+            edited_lyrics = file.read().decode('utf-8')
+
+    # save edited text as lyrics cache
+    store.put(key, edited_lyrics.splitlines(), track=track_name, source='edit')
+    canonical = get_key(track_name)
+    lyrics_cache.memory.invalidate(lambda k: k == key or k == canonical)
 
 
 def delete_lyrics(track_name):
-    ''' deletes local lyrics cache file
+    ''' deletes cached lyrics of track
         returns -> bool | whether the delete operation occured or not
     '''
-    filepath = get_filename(track_name)
-
-    if os.path.isfile(filepath):
-        # lyrics exist
-        os.remove(filepath)
-        return True
-
-    return False
+    key, _ = resolve_key(track_name)
+    canonical = get_key(track_name)
+    lyrics_cache.memory.invalidate(lambda k: k == key or k == canonical)
+    return lyrics_cache.get_store().delete(key)
 
 
 def align(lines, width, alignment=1):
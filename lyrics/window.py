@@ -2,10 +2,20 @@
 # -*- coding: utf-8 -*-
 
 from lyrics.player import Player
-from lyrics.config import Config
+from lyrics.config import Config, alignment, INOTIFY_ENABLED
+from lyrics.scheduler import Scheduler, POLL_MAX
+from lyrics.search import SearchIndex, MODES, PLAIN, REGEX, FUZZY
 from lyrics import __version__
 
 import curses
+import os
+import re
+import signal
+import sys
+
+# with synced lyrics, current line is kept this far (fraction of height)
+# from top of lyrics area
+SYNC_MARGIN = 1 / 3
 
 
 class Key:
@@ -29,7 +39,14 @@ class Key:
 		elif key == self.binds['cycle-source']:
 			window.player.refresh(cycle_source=True, cache=False)
 			window.current_pos = 0
-			window.update_track(True)
+			window.show_source = True
+			window.update_track()
+		elif key == self.binds['refresh']:
+			# re-fetch, skipping cached lyrics and recorded misses
+			window.player.refresh(cache=False)
+			window.current_pos = 0
+			window.show_source = True
+			window.update_track()
 			
 		# keys to change alignment
 		elif key == self.binds['left']:
@@ -47,6 +64,10 @@ class Key:
 
 		elif key == self.binds['delete']:
 			if window.player.track.delete_lyrics():
+				# a daemon drops its in-memory copy on refresh, as after edit
+				window.player.refresh(cache=True)
+				window.current_pos = 0
+				window.update_track()
 				window.stdscr.addstr(window.height - 1, 1,
 							' Deleted ', curses.A_REVERSE)
 		elif key == self.binds['help']:
@@ -85,7 +106,8 @@ class HelpPage:
 			# set representable strings to ascii values
 			if v in _keys.keys():
 				v = _keys[v]
-			elif k not in ['step-size', 'interval', 'mpd_port']:
+			elif k not in ['step-size', 'interval', 'max_interval', 'mpd_port', 'lookahead', 'miss_ttl',
+					   'cache_max_entries', 'cache_max_mb']:
 				if isinstance(v, int):
 					v = chr(v) # character values
 			self.win.addstr(i, j, f'{k:18} {v}')
@@ -144,6 +166,27 @@ class Window:
 		self.keys = Key()
 		self.find_position = 0
 		self.timeout = timeout
+		self.show_source = False
+		# lines currently written to scroll_pad
+		self.pad_lines = []
+		# view_state() of last drawn frame
+		self.last_state = None
+		# set by SIGWINCH, handled on next read_key()
+		self.resized = False
+		# synced lyrics line being sung and pad rows highlighted for it
+		self.synced_index = None
+		self.highlighted = range(0)
+		# ms until next synced line starts
+		self.due = None
+		# find index of pad_lines and pad rows highlighted as matches
+		self.search_index = None
+		self.match_rows = []
+
+		# without inotify, config file changes are only seen by polling its mtime
+		self.scheduler = Scheduler(timeout, self.options.getint('max_interval', POLL_MAX),
+					events=self.player.events, watched=INOTIFY_ENABLED)
+		# option values last applied, to tell which ones a reload changed
+		self.applied = dict(self.options.items())
 
 		curses.use_default_colors()
 		self.stdscr.timeout(self.timeout)
@@ -156,10 +199,7 @@ class Window:
 		
 		if self.player.running:
 			self.update_track()
-			self.set_titlebar()
-			self.stdscr.refresh()
-			self.scroll_pad.refresh(self.current_pos, 0, 4, 
-					self.pad_offset, self.height - 2, self.width - 1)
+			self.draw()
 		else:
 			self.stdscr.addstr(0, 1, f'{self.player.player_name} is not running!')
 			self.stdscr.refresh()
@@ -237,151 +277,330 @@ class Window:
 			self.find()
 		return False
 
-	def find(self):
-		# wait for input
-		self.stdscr.timeout(-1)
-		prompt = ':'
+	def search(self, query, mode):
+		# index is built once per rendered text on pad
+		if self.search_index is None or self.search_index.lines is not self.pad_lines:
+			self.search_index = SearchIndex(self.pad_lines)
+		return self.search_index.find(query, mode)
+
+	def show_matches(self, matches):
+		# highlights all matches on pad, replacing previous ones
+		pad_height, pad_width = self.scroll_pad.getmaxyx()
+		for y in self.match_rows:
+			if y < pad_height:
+				self.scroll_pad.chgat(y, 0, pad_width, curses.A_NORMAL)
+		# restore synced line highlight cleared above
+		for y in self.highlighted:
+			if y < pad_height:
+				self.scroll_pad.chgat(y, 0, pad_width, curses.A_BOLD)
+
+		self.match_rows = []
+		for y, spans in matches:
+			if y >= pad_height:
+				continue
+			for start, end in spans:
+				self.scroll_pad.chgat(y, start, end - start, curses.A_REVERSE)
+			self.match_rows.append(y)
+
+	def set_findbar(self, prompt, status='', help_output=''):
+		# find prompt and match count on last line
 		self.stdscr.move(self.height - 1, 0)
 		self.stdscr.clrtoeol()
-		self.stdscr.addstr(self.height - 1, self.pad_offset, prompt)
-		self.set_statusbar()
-		# show cursor and key presses during find
-		curses.echo()
-		curses.curs_set(1)
-
-		# (y, x, input max length), case-insensitive
-		find_string = self.stdscr.getstr(self.height - 1, len(prompt) + self.pad_offset, 100)
-		find_string = find_string.decode(encoding="utf-8").strip()
-
-		# hide cursor and key presses
-		curses.curs_set(0)
-		curses.noecho()
-
-		if find_string:
-			# use word wrap which covers both wrap/nowrap and ensures line count is accurate
-			text = self.player.track.get_text(wrap=True, width=self.width - self.text_padding)
-			lines = text.split('\n')
-
-			# [0,9,10,14] list of lines that contain a match
-			lines_map = []
-			for line_num, line in enumerate(lines):
-				# case-insensitive match
-				if find_string.lower() in line.lower():
-					lines_map.append(line_num)
-
-			if len(lines_map) > 0:
-
-				# continue search from current position
-				for line in lines_map:
-					# >= causes us to stay on the current line for a new search
-					if line >= self.current_pos:
-						self.find_position = lines_map.index(line)
-						break
-				# otherwise loop back to the start
-				else:
-					self.find_position = 0
-
-				while True:
-					# update current position based on where we are at in the find
-					self.current_pos = lines_map[self.find_position]
-
-					# duplicated from main() to manually refresh on find
-					self.stdscr.clear()
-					self.set_titlebar()
-					self.stdscr.refresh()
-					self.scroll_pad.refresh(self.current_pos, 0, 4, self.pad_offset, self.height - 2, self.width - 1)
-
-					# find & status bar output
-					find_string_output = f' {find_string} '
-					find_count_output = f" {self.find_position + 1}/{len(lines_map)} "
-					self.stdscr.addstr(self.height - 1, self.pad_offset, find_string_output, curses.A_REVERSE)
-					self.stdscr.insstr(self.height - 1, self.pad_offset + len(find_string_output) + 1, find_count_output)
-					# multiple matches, show next/prev
-					if len(lines_map) > 1:
-						help_output = f"[{chr(self.keys.binds['find-next'])}]=next, [{chr(self.keys.binds['find-prev'])}]=prev"
-						self.stdscr.addstr(self.height - 1, self.pad_offset + len(find_string_output) + len(find_count_output) + 2, help_output)
-					self.set_statusbar()
-
-					# highlight found text
-					line_text = lines[self.current_pos]
-					# case-insensitive, [4, 5, 21]
-					found_index_list = [i for i in range(len(line_text)) if line_text.lower().startswith(find_string.lower(), i)]
-					# loop over each character in the line, highlight found strings
-					highlight_end = -1
-					for cpos, char in enumerate(line_text):
-						attr = curses.A_NORMAL
-						# start of found string
-						if cpos in found_index_list:
-							highlight_end = cpos + len(find_string)
-							attr = curses.A_REVERSE
-						# inside string
-						elif highlight_end > cpos:
-							attr = curses.A_REVERSE
-						self.stdscr.addch(4, self.pad_offset + cpos, char, attr)
-
-					# after finding a match in a line, stop, wait for input
-					self.stdscr.timeout(10000)
-					key = self.stdscr.getch()
-					result = self.find_check_keys(key, lines_map)
-					if not result:
-						break
-
+		# leave room for statusbar
+		limit = self.width - 8
+
+		x = 1
+		for text, attr in ((f' {prompt} ', curses.A_REVERSE),
+				(f' {status} ' if status else '', curses.A_NORMAL),
+				(help_output, curses.A_NORMAL)):
+			if text and x < limit:
+				self.stdscr.addnstr(self.height - 1, x, text, limit - x, attr)
+				x += len(text) + 1
+
+	def first_match(self, lines_map, position):
+		# continue search from position, otherwise loop back to the start
+		for i, line in enumerate(lines_map):
+			# >= causes us to stay on the current line for a new search
+			if line >= position:
+				return i
+		return 0
+
+	def read_query(self, start_pos):
+		# reads find string, matches are updated and highlighted on every
+		# key press. tab cycles plain/regex/fuzzy mode
+		# returns (query, mode, matches), query is '' if find was cancelled
+		query = ''
+		mode = 0
+		prefixes = {PLAIN: ':', REGEX: 're:', FUZZY: '~:'}
+
+		while True:
+			try:
+				matches = self.search(query, MODES[mode])
+				status = f'{len(matches)} lines' if matches else ('not found' if query else '')
+			except re.error:
+				matches = []
+				status = 'invalid pattern'
+
+			lines_map = [y for y, _ in matches]
+			if matches:
+				self.find_position = self.first_match(lines_map, start_pos)
+				self.current_pos = lines_map[self.find_position]
 			else:
-				output = ' not found '
-				self.stdscr.insstr(self.height - 1, self.pad_offset + len(prompt) + len(find_string) + 2, output, curses.A_REVERSE)
-				self.set_statusbar()
-				# timeout or key press
-				self.stdscr.timeout(5000)
+				self.current_pos = start_pos
+
+			self.show_matches(matches)
+			# block cursor
+			self.set_findbar(f'{prefixes[MODES[mode]]}{query}\u2588', status)
+			self.draw()
+
+			try:
+				char = self.stdscr.get_wch()
+			except curses.error:
+				continue
+
+			if char in ('\n', '\r', curses.KEY_ENTER):
+				return query, MODES[mode], matches
+			elif char == '\x1b' or (char in ('\x7f', '\b', curses.KEY_BACKSPACE) and not query):
+				self.current_pos = start_pos
+				return '', MODES[mode], []
+			elif char in ('\x7f', '\b', curses.KEY_BACKSPACE):
+				query = query[:-1]
+			elif char == '\t':
+				mode = (mode + 1) % len(MODES)
+			elif char == curses.KEY_RESIZE:
+				self.height, self.width = self.stdscr.getmaxyx()
+			elif isinstance(char, str) and char.isprintable():
+				query += char
+
+	def find(self):
+		# wait for input
+		self.stdscr.timeout(-1)
+		if hasattr(curses, 'set_escdelay'):
+			# escape cancels find without the default 1s delay
+			curses.set_escdelay(25)
+
+		start_pos = self.current_pos
+		query, mode, matches = self.read_query(start_pos)
+		lines_map = [y for y, _ in matches]
+
+		if lines_map:
+			while True:
+				# update current position based on where we are at in the find
+				self.current_pos = lines_map[self.find_position]
+
+				help_output = ''
+				# multiple matches, show next/prev
+				if len(lines_map) > 1:
+					help_output = f"[{chr(self.keys.binds['find-next'])}]=next, [{chr(self.keys.binds['find-prev'])}]=prev"
+				self.set_findbar(query, f'{self.find_position + 1}/{len(lines_map)}', help_output)
+				self.draw()
+
+				# after finding a match in a line, stop, wait for input
+				self.stdscr.timeout(10000)
 				key = self.stdscr.getch()
-				self.find_check_keys(key, lines_map)
+				result = self.find_check_keys(key, lines_map)
+				if not result:
+					break
+
+		elif query:
+			self.set_findbar(query, 'not found')
+			self.draw()
+			# timeout or key press
+			self.stdscr.timeout(5000)
+			key = self.stdscr.getch()
+			self.find_check_keys(key, lines_map)
 
+		self.show_matches([])
 		# clear search line
-		self.stdscr.clear()
+		self.stdscr.erase()
 		self.stdscr.timeout(self.timeout)
 
 	def update_track(self, show_source=False):
-		self.stdscr.clear()
-		self.scroll_pad.clear()
+		self.stdscr.erase()
 
 		if self.player.track.width > self.width - self.text_padding:
-			text = self.player.track.get_text(wrap=True, 
+			lines = self.player.track.get_lines(wrap=True,
 						width=self.width - self.text_padding)
 		else:
-			text = self.player.track.get_text()
+			lines = self.player.track.get_lines()
 
 		pad_height = max(self.height, self.player.track.length) + 2
 		pad_width = max(self.width, self.player.track.width) + 2
 
-		self.scroll_pad.resize(pad_height, pad_width)
-		self.scroll_pad.addstr(text)
+		if self.scroll_pad.getmaxyx() != (pad_height, pad_width):
+			self.scroll_pad.resize(pad_height, pad_width)
+		self.highlight(range(0))
+		self.write_pad(lines)
+		# rows may have moved, highlight again on next sync_position()
+		self.synced_index = None
 		self.set_offset()
+		# screen was erased, next tick has to draw
+		self.last_state = None
 
 		if show_source:
 			self.stdscr.addstr(self.height - 1, 1,
                     f" Source: {self.player.track.source}", curses.A_REVERSE)
 
+	def write_pad(self, lines):
+		# only rewrite pad lines that differ from what it holds
+		pad_height = self.scroll_pad.getmaxyx()[0]
+		old_lines = self.pad_lines
+
+		for y, line in enumerate(lines):
+			if y < len(old_lines) and old_lines[y] == line:
+				continue
+			self.scroll_pad.move(y, 0)
+			self.scroll_pad.clrtoeol()
+			self.scroll_pad.addstr(y, 0, line)
+
+		for y in range(len(lines), min(len(old_lines), pad_height)):
+			self.scroll_pad.move(y, 0)
+			self.scroll_pad.clrtoeol()
+
+		self.pad_lines = lines
+
+	def highlight(self, rows):
+		# moves highlight of synced line to rows
+		pad_height, pad_width = self.scroll_pad.getmaxyx()
+		for y in self.highlighted:
+			if y < pad_height:
+				self.scroll_pad.chgat(y, 0, pad_width, curses.A_NORMAL)
+		for y in rows:
+			if y < pad_height:
+				self.scroll_pad.chgat(y, 0, pad_width, curses.A_BOLD)
+		self.highlighted = rows
+
+	def sync_position(self):
+		# follows playback position with synced lyrics, scrolls and
+		# highlights only when the line being sung changes
+		track = self.player.track
+		self.due = None
+		if track.synced is None or not self.player.running:
+			return
+
+		position, playing = self.player.position()
+		if position is None:
+			return
+
+		index = track.synced.index(position)
+		if index != self.synced_index:
+			self.synced_index = index
+			rows = track.line_rows(index)
+			self.highlight(rows)
+			if rows:
+				margin = int((self.height - 6) * SYNC_MARGIN)
+				self.current_pos = max(0, rows[0] - margin)
+
+		if playing:
+			self.due = track.synced.next_change(position)
+
+	def view_state(self):
+		# everything that is visible on screen
+		track = self.player.track
+		return (self.player.running, self.player.player_name, track.track_name,
+				track.album, track.source, track.length, track.width, track.alignment,
+				self.current_pos, self.pad_offset, self.height, self.width,
+				self.synced_index)
+
+	def draw(self):
+		# batch stdscr and pad into a single terminal update
+		self.set_titlebar()
+		self.set_statusbar()
+		self.stdscr.noutrefresh()
+		# stdscr may have blanked pad area, copy all visible pad lines again
+		self.scroll_pad.touchwin()
+		self.scroll_pad.noutrefresh(self.current_pos, 0, 4,
+					self.pad_offset, self.height - 2, self.width - 1)
+		curses.doupdate()
+
+	def on_resize(self, signum, frame):
+		self.resized = True
+		self.scheduler.wake()
+
+	def read_key(self, last_key):
+		if self.resized:
+			self.resized = False
+			lines, cols = os.get_terminal_size(sys.__stdout__.fileno())
+			curses.resizeterm(lines, cols)
+			return curses.KEY_RESIZE
+
+		# curses may hold more buffered input after a key, read it first
+		if last_key == -1:
+			self.scheduler.wait(sys.stdin.fileno(), self.scheduler.timeout(self.due))
+
+		self.stdscr.timeout(0)
+		return self.stdscr.getch()
+
 	def main(self):
 		key = ''
 
-		while key != self.keys.binds['quit']:
-			key = self.stdscr.getch()
+		# sleep in select() until input, a watcher event or the next poll
+		self.player.add_callback(self.scheduler.wake)
+		self.options.add_callback(self.scheduler.wake)
+		previous_handler = signal.signal(signal.SIGWINCH, self.on_resize)
+
+		try:
+			while key != self.keys.binds['quit']:
+				key = self.read_key(key)
+				self.tick(key)
+		finally:
+			signal.signal(signal.SIGWINCH, previous_handler)
+			self.scheduler.close()
+
+	def apply_options(self):
+		# config file was reloaded, apply options that changed in it
+		options = dict(self.options.items())
+		changed = {k for k in options.keys() | self.applied.keys()
+				if options.get(k) != self.applied.get(k)}
+		self.applied = options
+
+		if changed & {'interval', 'max_interval'}:
+			self.timeout = self.options.getint('interval', self.timeout)
+			self.scheduler.set_interval(self.timeout,
+						self.options.getint('max_interval', POLL_MAX))
+		if 'priority' in changed:
+			self.player.track.sources = self.options.getlist('priority') or self.player.track.sources
+		if 'player_priority' in changed:
+			self.player.player_priority = self.options.getlist('player_priority', [])
+		if 'lookahead' in changed:
+			self.player.lookahead = self.options.getint('lookahead', 0)
+		if 'alignment' in changed:
+			self.player.track.alignment = alignment(self.options.get('alignment'))
+			self.player.track.reset_width()
+
+		self.update_track()
+
+	def tick(self, key):
+		self.height, self.width = self.stdscr.getmaxyx()
+
+		if self.options.poll():
+			self.apply_options()
+
+		if key == -1:
+			if self.player.update():
+				self.current_pos = 0
+				self.update_track()
 
-			self.height, self.width = self.stdscr.getmaxyx()
-
-			if key == -1:
-				if self.player.update():
-					self.current_pos = 0
-					self.update_track()
-					
-			if self.player.running:
-				self.keys.input(self, key)
-
-				self.set_titlebar()
-				self.set_statusbar()
-				self.stdscr.refresh()
-				self.scroll_pad.refresh(self.current_pos, 0, 4, 
-							self.pad_offset, self.height - 2, self.width - 1)
-			else:
-				self.stdscr.clear()
-				self.stdscr.addstr(0, 1, f'{self.player.player_name} player is not running.')
-				self.stdscr.refresh()
+		if self.player.fetch():
+			self.update_track(self.show_source)
+			self.show_source = False
+
+		if self.player.running:
+			self.keys.input(self, key)
+
+		self.sync_position()
+
+		# redraw only if a key was handled or something visible changed
+		state = self.view_state()
+		if key == -1 and state == self.last_state:
+			self.scheduler.backoff(playing=self.player.running)
+			return
+		self.last_state = state
+		self.scheduler.reset()
+
+		if self.player.running:
+			self.draw()
+		else:
+			self.stdscr.erase()
+			self.stdscr.addstr(0, 1, f'{self.player.player_name} player is not running.')
+			self.stdscr.refresh()
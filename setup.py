@@ -76,7 +76,13 @@ setup(
     ],
     extras_require={
         'mpd': ['python-mpd2'],
-        'full': ['python-mpd2']
+        'brotli': ['brotli'],
+        'events': ['PyGObject'],
+        'tags': ['mutagen'],
+        'inotify': ['inotify_simple'],
+        'zstd': ['zstandard'],
+        'full': ['python-mpd2', 'brotli', 'PyGObject', 'mutagen', 'inotify_simple',
+                 'zstandard']
     },
     python_requires='>=3.7',
     cmdclass={